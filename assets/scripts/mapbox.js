@@ -1,23 +1,24 @@
 const MAP_CENTER_COORDS = [20.4568974, 44.8178131];  // Belgrade
 const MAP_DEFAULT_ZOOM = 4.3;
+const EMPTY_FEATURE_COLLECTION = {type: 'FeatureCollection', features: []};
 const MAPBOX = {
   selector: '#map',
   script: 'https://api.mapbox.com/mapbox-gl-js/v2.14.1/mapbox-gl.js',
   style: 'mapbox://styles/mapbox/dark-v11',
   center: MAP_CENTER_COORDS,
   pointLayout: {
-    'circle-color': ['get', 'color'],
+    'circle-color': ['coalesce', ['get', 'color'], 'grey'],
     'circle-stroke-width': 2,
     'circle-stroke-color': 'white',
     'circle-opacity': 0.9,
-    'circle-radius': 8,
+    'circle-radius': ['interpolate', ['linear'], ['coalesce', ['get', 'pointCount'], 1], 1, 8, 20, 16],
   },
   locationLayout: {
     'circle-color': 'white',
     'circle-stroke-width': 1,
     'circle-stroke-color': 'white',
     'circle-opacity': 0.55,
-    'circle-radius': 4,
+    'circle-radius': ['interpolate', ['linear'], ['coalesce', ['get', 'pointCount'], 1], 1, 4, 20, 10],
   },
 };
 
@@ -74,10 +75,11 @@ function onMapLoad({target: map}) {
 }
 
 function addMapPoints(map) {
-  let dataSource = map.getContainer().dataset.mapPointsSrc;
-  if (!dataSource)
+  let tilesSource = map.getContainer().dataset.mapPointsTiles;
+  if (!tilesSource)
     return;
-  map.addSource('points', {type: 'geojson', data: dataSource});
+  map.addSource('points', {type: 'geojson', data: EMPTY_FEATURE_COLLECTION});
+  loadTiledSource(map, 'points', tilesSource);
   map.addLayer({
     id: 'points',
     source: 'points',
@@ -96,10 +98,11 @@ function addMapPoints(map) {
 }
 
 function addMapLocations(map) {
-  let dataSource = map.getContainer().dataset.mapLocSrc;
-  if (!dataSource)
+  let tilesSource = map.getContainer().dataset.mapLocTiles;
+  if (!tilesSource)
     return;
-  map.addSource('locations', {type: 'geojson', data: dataSource});
+  map.addSource('locations', {type: 'geojson', data: EMPTY_FEATURE_COLLECTION});
+  loadTiledSource(map, 'locations', tilesSource);
   map.addLayer({
     id: 'locations',
     source: 'locations',
@@ -108,17 +111,95 @@ function addMapLocations(map) {
   });
 }
 
+// Clustered points are prebuilt per zoom level and cut into tiles, see `utils/geotiles.py`:
+// only tiles in view at the current (clamped) zoom level are fetched and shown
+function loadTiledSource(map, sourceId, baseUrl) {
+  let index = fetchJSON(`${baseUrl}index.json`);
+  let tiles = new Map();
+  let currentKeys = '';
+  let update = async () => {
+    let {minZoom, maxZoom, zoomOffset, tiles: available} = await index;
+    let zoom = Math.min(Math.max(Math.floor(map.getZoom()), minZoom), maxZoom);
+    let keys = getVisibleTiles(map.getBounds(), zoom, Math.max(zoom - zoomOffset, 0))
+      .filter(key => available.includes(key));
+    if (keys.join() === currentKeys)
+      return;
+    currentKeys = keys.join();
+    for (let key of keys)
+      if (!tiles.has(key))
+        tiles.set(key, fetchJSON(`${baseUrl}${key}.json`).then(decodeGeodata));
+    let collections = await Promise.all(keys.map(key => tiles.get(key)));
+    if (keys.join() === currentKeys)
+      map.getSource(sourceId).setData({
+        type: 'FeatureCollection',
+        features: collections.flatMap(collection => collection.features),
+      });
+  };
+  map.on('moveend', update);
+  update();
+}
+
+// Compact columnar geodata (`GEODATA_COMPACT`) back to GeoJSON, see `utils/geoencoding.py`
+function decodeGeodata(data) {
+  if (data.type === 'FeatureCollection')
+    return data;
+  let {precision, count, values, coords, properties: columns} = data;
+  let scale = 10 ** precision;
+  let columnEntries = Object.entries(columns);
+  let features = new Array(count);
+  let [lng, lat] = [0, 0];
+  for (let index = 0; index < count; index++) {
+    lng += coords[index * 2];
+    lat += coords[index * 2 + 1];
+    let properties = {};
+    for (let [key, column] of columnEntries)
+      if (column[index] !== -1)
+        properties[key] = values[column[index]];
+    features[index] = {
+      type: 'Feature',
+      properties,
+      geometry: {type: 'Point', coordinates: [lng / scale, lat / scale]},
+    };
+  }
+  return {type: 'FeatureCollection', features};
+}
+
+function getVisibleTiles(bounds, zoom, tileZoom) {
+  let size = 2 ** tileZoom;
+  let tileX = lng => Math.floor((lng + 180) / 360 * size);
+  let tileY = lat => {
+    let sinLat = Math.sin(Math.max(Math.min(lat, 85.051129), -85.051129) * Math.PI / 180);
+    let y = 0.5 - 0.25 * Math.log((1 + sinLat) / (1 - sinLat)) / Math.PI;
+    return Math.min(Math.max(Math.floor(y * size), 0), size - 1);
+  };
+  let [minX, maxX] = [tileX(bounds.getWest()), tileX(bounds.getEast())];
+  if (maxX - minX >= size)
+    [minX, maxX] = [0, size - 1];
+  let keys = new Set();
+  for (let x = minX; x <= maxX; x++)
+    for (let y = tileY(bounds.getNorth()); y <= tileY(bounds.getSouth()); y++)
+      keys.add(`${zoom}/${(x % size + size) % size}/${y}`);
+  return [...keys];
+}
+
 function onPointHover({target: map, features: [point, ..._]}, popup) {
-  let {title, url} = point.properties;
+  let {title, url, cluster} = point.properties;
+  map.getCanvas().style.cursor = 'pointer';
+  if (cluster && !url)
+    return;
   let coordinates = point.geometry.coordinates.slice();
   let content = `<a href=${url} target=_blank rel=noopener>${title}</a>`;
-  map.getCanvas().style.cursor = 'pointer';
   popup.setLngLat(coordinates).setHTML(content).addTo(map);
   popup.getElement().addEventListener('click', () => trackPointClick(point));
   popup.getElement().style.setProperty('--popup-color', point.properties.color);
 }
 
-function onPointClick({features: [point, ..._]}) {
+function onPointClick({target: map, features: [point, ..._]}) {
+  let {cluster, expansionZoom} = point.properties;
+  if (cluster) {
+    map.easeTo({center: point.geometry.coordinates, zoom: expansionZoom});
+    return;
+  }
   trackPointClick(point);
   window.open(point.properties.url, '_blank', 'noopener');
 }
@@ -129,6 +210,10 @@ function trackPointClick(point) {
     umami.track('map-point-clicked', {url: point.properties.url});
 }
 
+function fetchJSON(url) {
+  return fetch(url).then(response => response.json());
+}
+
 function loadScript(src, defer = true) {
   let script = document.createElement('script');
   return new Promise((resolve, reject) => {
@@ -0,0 +1,46 @@
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from re import compile as re_compile
+from time import perf_counter
+
+from jinja2 import Environment, FileSystemLoader
+from pelican.settings import read_settings
+
+from markup import renderer_ref
+from pelicanconf import PATH
+
+SETTINGS_FILE = 'pelicanconf.py'
+PICTURE_BLOCK_PATTERN = re_compile(r'^\[pic.+]$')
+
+
+def setup_renderer() -> Environment:
+    from markup.renderers import FILTERS, GLOBALS
+
+    settings = read_settings(SETTINGS_FILE)
+    loader = FileSystemLoader(Path(settings['THEME']) / 'templates')
+    env = Environment(loader=loader, **settings['JINJA_ENVIRONMENT'])
+    env.globals.update(GLOBALS)
+    env.filters.update(FILTERS)
+    renderer_ref.set(env)
+    return env
+
+
+def iter_picture_blocks(path: str | Path = PATH) -> Iterator[str]:
+    for article in sorted(Path(path).glob('*.md')):
+        for line in article.read_text().splitlines():
+            if PICTURE_BLOCK_PATTERN.match(line):
+                yield line
+
+
+def measure(
+    func: Callable[[], object], rounds: int = 5, setup: Callable[[], object] | None = None
+) -> float:
+    # `setup` runs before each round, untimed
+    best = float('inf')
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        started = perf_counter()
+        func()
+        best = min(best, perf_counter() - started)
+    return best
@@ -0,0 +1,70 @@
+"""Render articles concurrently and check every document keeps its own pictures.
+
+Usage: python -m benchmarks.concurrency [rounds]
+"""
+
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+
+from pelican.readers import MarkdownReader
+from pelican.settings import read_settings
+
+from benchmarks import PICTURE_BLOCK_PATTERN, SETTINGS_FILE
+from markup.processors.picture import (
+    PICTURE_REGISTRY_METADATA_KEY,
+    Picture,
+    PictureBlockProcessor,
+    PictureRegistry,
+)
+from pelicanconf import PATH
+
+DEFAULT_ROUNDS = 4
+
+
+def get_expected_sources(text: str) -> list[str]:
+    sources = []
+    for line in text.splitlines():
+        if PICTURE_BLOCK_PATTERN.match(line):
+            match = PictureBlockProcessor.REGEX.match(line)
+            sources.append(Picture.parse_attrs(match.group(1)).get('src'))
+    return [src for src in sources if src]
+
+
+@cache
+def get_settings() -> dict:
+    return read_settings(SETTINGS_FILE)
+
+
+def render(path: Path) -> tuple[Path, list[str]]:
+    reader = MarkdownReader(get_settings())
+    _, metadata = reader.read(str(path))
+    registry: PictureRegistry = metadata.get(PICTURE_REGISTRY_METADATA_KEY) or PictureRegistry()
+    return path, [picture.src for picture in registry]
+
+
+def check(executor: Executor, paths: list[Path]) -> int:
+    errors = 0
+    for path, sources in executor.map(render, paths):
+        if sources != get_expected_sources(path.read_text()):
+            errors += 1
+            print(f'Pictures mixed up in {path}', file=sys.stderr)
+    return errors
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROUNDS
+    paths = sorted(Path(PATH).glob('*.md')) * rounds
+    errors = 0
+    for executor_class in (ThreadPoolExecutor, ProcessPoolExecutor):
+        with executor_class() as executor:
+            errors += check(executor, paths)
+        print(f'{executor_class.__name__}: {len(paths)} documents rendered')
+    if errors:
+        raise SystemExit(f'{errors} documents with mixed up pictures')
+    print('All documents have their own pictures')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic articles corpus: N articles × M `[pic]` blocks, shaped like the real ones.
+
+Usage: python -m benchmarks.corpus <path> [articles] [pictures]
+"""
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from random import Random
+from typing import NamedTuple
+
+DEFAULT_ARTICLES = 40
+DEFAULT_PICTURES = 60
+DEFAULT_SEED = 0
+
+# Attribute mix of the real articles: most sources carry dimensions in the filename,
+# a quarter only a ratio, a few a cache-busting version, crop or explicit orientation
+SOURCE_DIMENSIONS = ((6000, 4000), (4000, 6000), (3626, 2040), (2326, 4134), (1884, 1884))
+RATIOS = ('16:9', '9:16', '3:4', '4:3', '1:1')
+GRID_SPANS = (4, 4, 4, 5, 6, 8, 12)
+CROPS = ('0.8:0.8', '0.5:1:ce', '1:0.6:so')
+COLORS = ('#3D7787', '#A35D3B', '#5E6B2F', '#7A4E8C', '#2F5E8C', '#8C2F45')
+
+
+class Corpus(NamedTuple):
+    path: Path
+    articles: int
+    pictures: int
+    points: int
+
+
+def generate_picture_block(rng: Random, slug: str, index: int) -> str:
+    name = f'{slug}/IMG_{1000 + index}'
+    attrs = []
+    if rng.random() < 0.75:
+        width, height = rng.choice(SOURCE_DIMENSIONS)
+        attrs.append(f'src="{name}.{width}x{height}"')
+    else:
+        attrs.extend((f'src={name}', f'ratio={rng.choice(RATIOS)}'))
+    attrs.append(f'grid={rng.choice(GRID_SPANS)}|{rng.randrange(9)}')
+    if rng.random() < 0.05:
+        attrs.append(f'crop={rng.choice(CROPS)}')
+    if rng.random() < 0.05:
+        attrs.append('orient=portrait')
+    if rng.random() < 0.02:
+        attrs.append(f'v={rng.randrange(2, 5)}')
+    if index == 1:
+        attrs.append('eager')
+    return f'[pic {" ".join(attrs)}]'
+
+
+def generate_article(rng: Random, index: int, pictures: int) -> tuple[str, str, int]:
+    slug = f'synthetic-{index:04d}'
+    points = rng.randrange(1, 5)
+    lng, lat = rng.uniform(-10, 45), rng.uniform(30, 60)
+    coords = ';'.join(
+        f'{lng + rng.gauss(0, 1):.7f},{lat + rng.gauss(0, 1):.7f}' for _ in range(points)
+    )
+    published = date(2020, 1, 1) + timedelta(days=index * 7)
+    header = [
+        '---',
+        f'title: Synthetic {index}',
+        f'location: Place {index % 17}',
+        f'slug: {slug}',
+        f'date: {published.isoformat()}',
+        f'cover: {slug}/IMG_1001.6000x4000',
+        f'color: {rng.choice(COLORS)}',
+        f'og_image: {slug}/IMG_1001.6000x4000',
+        f'coords: {coords}',
+        '---',
+    ]
+    blocks = [generate_picture_block(rng, slug, number) for number in range(1, pictures + 1)]
+    return slug, '\n'.join(header) + '\n\n' + '\n\n'.join(blocks) + '\n', points
+
+
+def generate_corpus(
+    path: Path,
+    articles: int = DEFAULT_ARTICLES,
+    pictures: int = DEFAULT_PICTURES,
+    seed: int = DEFAULT_SEED,
+) -> Corpus:
+    # Same arguments, same corpus: results are comparable between runs
+    rng = Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    total_points = 0
+    for index in range(1, articles + 1):
+        slug, text, points = generate_article(rng, index, pictures)
+        (path / f'{slug}.md').write_text(text)
+        total_points += points
+    return Corpus(path, articles, articles * pictures, total_points)
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    path = Path(sys.argv[1])
+    articles = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ARTICLES
+    pictures = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PICTURES
+    corpus = generate_corpus(path, articles, pictures)
+    print(f'{corpus.articles} articles, {corpus.pictures} pictures, {corpus.points} points')
+
+
+if __name__ == '__main__':
+    main()
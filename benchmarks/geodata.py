@@ -0,0 +1,85 @@
+"""Map geodata payload: GeoJSON vs compact columnar encoding, size (raw/gzip) and parse time.
+
+Points are read from the last build output, locations from the dataset. Synthetic sets repeat
+features with jittered coords, as a stand-in for a grown archive.
+
+Usage: python -m benchmarks.geodata [scale ...]
+"""
+
+import sys
+from gzip import compress as gzip_compress
+from json import loads as json_loads
+from random import Random
+
+from benchmarks import measure
+from markup.renderers import POINTS_GEOJSON
+from utils.datastructures import get_geodata_from_dataset
+from utils.geoencoding import (
+    GEODATA_COMPACT_PRECISION,
+    decode_geodata,
+    dump_geodata,
+)
+
+SCALES = (1, 50)
+JITTER = 0.5  # degrees
+
+
+def load_points() -> dict:
+    if not POINTS_GEOJSON.is_file():
+        raise SystemExit(f'{POINTS_GEOJSON} is missing, build the site first')
+    data = json_loads(POINTS_GEOJSON.read_text())
+    return data if data.get('type') == 'FeatureCollection' else decode_geodata(data)
+
+
+def scale_geodata(geodata: dict, scale: int, seed: int = 0) -> dict:
+    random = Random(seed)
+    features = list(geodata['features'])
+    for _ in range(scale - 1):
+        for feature in geodata['features']:
+            lng, lat = feature['geometry']['coordinates'][:2]
+            coords = [lng + random.uniform(-JITTER, JITTER), lat + random.uniform(-JITTER, JITTER)]
+            features.append({**feature, 'geometry': {'type': 'Point', 'coordinates': coords}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def check_roundtrip(geodata: dict) -> None:
+    decoded = decode_geodata(json_loads(dump_geodata(geodata, compact=True)))
+    tolerance = 10**-GEODATA_COMPACT_PRECISION
+    for original, feature in zip(geodata['features'], decoded['features'], strict=True):
+        if original['properties'] != feature['properties']:
+            raise SystemExit(f'Properties mismatch: {original} != {feature}')
+        original_coords, coords = (item['geometry']['coordinates'] for item in (original, feature))
+        coords = zip(original_coords, coords, strict=True)
+        if any(abs(a - b) > tolerance for a, b in coords):
+            raise SystemExit(f'Coordinates mismatch: {original} != {feature}')
+
+
+def report(name: str, geodata: dict) -> None:
+    check_roundtrip(geodata)
+    geojson = dump_geodata(geodata, compact=False)
+    compact = dump_geodata(geodata, compact=True)
+    geojson_time = measure(lambda: json_loads(geojson), rounds=20)
+    compact_time = measure(lambda: decode_geodata(json_loads(compact)), rounds=20)
+    for label, payload, elapsed in (
+        ('geojson', geojson, geojson_time),
+        ('compact', compact, compact_time),
+    ):
+        raw = payload.encode()
+        print(
+            f'{name:<22} {label}: {len(raw) / 1024:>8.1f} KiB raw, '
+            f'{len(gzip_compress(raw, 9)) / 1024:>7.1f} KiB gzip, '
+            f'parse{" + decode" if label == "compact" else ""} {elapsed * 1000:.2f}ms'
+        )
+
+
+def main() -> None:
+    scales = [int(arg) for arg in sys.argv[1:]] or SCALES
+    datasets = {'points': load_points(), 'locations': get_geodata_from_dataset()}
+    for scale in scales:
+        for name, geodata in datasets.items():
+            features = len(geodata['features']) * scale
+            report(f'{name} x{scale} ({features})', scale_geodata(geodata, scale))
+
+
+if __name__ == '__main__':
+    main()
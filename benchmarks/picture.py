@@ -0,0 +1,82 @@
+"""Per-picture cost of `[pic]` element creation: template render + XML reparse vs direct build.
+The template `[pic]` markup was originally rendered from is kept here, as the reference.
+
+Usage: python -m benchmarks.picture
+"""
+
+from xml.etree.ElementTree import Element
+from xml.etree.ElementTree import fromstring as xml_from_string
+
+from jinja2 import Template
+from markdown.serializers import to_html_string
+
+from benchmarks import iter_picture_blocks, measure, setup_renderer
+from markup.processors.picture import Picture, PictureBlockProcessor, create_picture_element
+
+LEGACY_PICTURE_TEMPLATE = """\
+<figure
+  data-src="{{ src }}"
+  data-index="{{ index or 0 }}"
+  data-span="{{ span }}"
+  data-offset="{{ offset or 0 }}"
+  id="{{ id or uuid() }}"
+>
+<picture style="--ratio: {{ ratio or 1 }};{% if placeholder %}\
+ --placeholder: url({{ placeholder }});{% endif %}">
+  {% set width, height = dimensions if dimensions else (0, 0) %}
+  {% for source in sources %}
+    <source srcset="{{ source.srcset|join(', ') }}" media="{{ source.media_query }}"/>
+  {% endfor %}
+  <img
+    src="{{ fallback }}"
+    alt="{{ alt }}"
+    loading="{{ loading or 'lazy' }}"
+    fetchpriority="{{ fetch_priority or 'auto' }}"
+    width="{{ width }}"
+    height="{{ height }}"
+    onload="this.dataset.loaded = 'true'"
+  />
+</picture>{% if caption %}<figcaption>{{ caption|safe }}</figcaption>{% endif %}
+</figure>
+"""
+
+
+def create_picture_element_from_template(template: Template, ctx: dict) -> Element:
+    return xml_from_string(template.render(ctx))
+
+
+def load_pictures() -> list[Picture]:
+    pictures = []
+    for index, block in enumerate(iter_picture_blocks(), start=1):
+        match = PictureBlockProcessor.REGEX.match(block)
+        picture = Picture.parse(match.group(1), index=index)
+        if picture.src:
+            pictures.append(picture)
+    return pictures
+
+
+def main() -> None:
+    template = setup_renderer().from_string(LEGACY_PICTURE_TEMPLATE)
+    pictures = load_pictures()
+
+    contexts = [picture.get_context() for picture in pictures]
+    for ctx in contexts:
+        expected = to_html_string(create_picture_element_from_template(template, ctx))
+        if to_html_string(create_picture_element(ctx)) != expected:
+            raise SystemExit(f'Output mismatch for picture {ctx["src"]}')
+
+    results = {
+        'template+reparse': measure(
+            lambda: [create_picture_element_from_template(template, ctx) for ctx in contexts]
+        ),
+        'direct': measure(lambda: [create_picture_element(ctx) for ctx in contexts]),
+    }
+    baseline = results['template+reparse']
+    print(f'{len(pictures)} pictures, output identical')
+    for name, elapsed in results.items():
+        per_picture = elapsed / len(pictures) * 1e6
+        print(f'{name:>18}: {per_picture:8.1f} µs/picture  ({baseline / elapsed:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Articles Markdown conversion: serial vs process pool (`PARALLEL_RENDERING`), by worker count.
+
+Usage: python -m benchmarks.rendering [workers ...]
+"""
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+
+from pelican.readers import MarkdownReader
+from pelican.settings import read_settings
+
+from benchmarks import SETTINGS_FILE, setup_renderer
+from markup.parallel import _get_pool_context, render_markdown
+from pelicanconf import PATH
+
+
+def main() -> None:
+    setup_renderer()
+    settings = read_settings(SETTINGS_FILE)
+    markdown_settings = MarkdownReader(settings).settings['MARKDOWN']
+    paths = [str(path.resolve()) for path in sorted(Path(PATH).glob('*.md'))]
+    cores = cpu_count() or 1
+    worker_counts = [int(arg) for arg in sys.argv[1:]] or sorted({1, 2, cores})
+
+    started = perf_counter()
+    serial = [render_markdown(path, markdown_settings).content for path in paths]
+    serial_time = perf_counter() - started
+    print(f'{len(paths)} articles, {cores} cores, serial: {serial_time:.2f}s')
+
+    for workers in worker_counts:
+        started = perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_get_pool_context()) as executor:
+            results = executor.map(render_markdown, paths, repeat(markdown_settings))
+            contents = [rendered.content for rendered in results]
+        elapsed = perf_counter() - started
+        if contents != serial:
+            raise SystemExit(f'{workers} workers output differs from serial')
+        print(f'{workers:>2} workers: {elapsed:.2f}s, {serial_time / elapsed:.2f}x speedup')
+
+
+if __name__ == '__main__':
+    main()
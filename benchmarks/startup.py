@@ -0,0 +1,75 @@
+"""Cold start of invoke tasks and config import: wall time until a task would start its work
+(`invoke --help <task>` loads and parses everything running it does), with `-X importtime`
+heaviest top-level imports.
+
+Usage: python -m benchmarks.startup [task ...]
+"""
+
+import sys
+from subprocess import run
+from time import perf_counter
+
+from invoke import Collection
+
+import tasks
+
+ROUNDS = 5
+TOP_IMPORTS = 5
+EXPANDED_MODULES = frozenset({'pelicanconf', 'utils', 'tasks'})
+
+
+def get_targets(task_names: list[str]) -> dict[str, list[str]]:
+    targets = {
+        'python': ['-c', 'pass'],
+        'import pelicanconf': ['-c', 'import pelicanconf'],
+        'import utils': ['-c', 'import utils'],
+        'import tasks': ['-c', 'import tasks'],
+    }
+    for name in task_names:
+        targets[f'invoke {name}'] = ['-m', 'invoke', '--help', name]
+    return targets
+
+
+def parse_importtime(output: str) -> tuple[int, list[tuple[int, str]]]:
+    # `import time: self [us] | cumulative | imported package`, nested ones indented after
+    # their own imports; project modules are replaced by what they import
+    total, imports, children = 0, [], []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = (int(cumulative), name.strip())
+        if depth == 1:
+            children.append(entry)
+        elif depth == 0:
+            total += entry[0]
+            imports.extend(children if entry[1] in EXPANDED_MODULES else [entry])
+            children = []
+    return total, sorted(imports, reverse=True)
+
+
+def measure_target(args: list[str]) -> tuple[float, tuple[int, list[tuple[int, str]]]]:
+    best, imports = float('inf'), (0, [])
+    for _ in range(ROUNDS):
+        started = perf_counter()
+        command = [sys.executable, '-X', 'importtime', *args]
+        result = run(command, capture_output=True, text=True)
+        elapsed = perf_counter() - started
+        if result.returncode:
+            raise SystemExit(f'{" ".join(args)} failed:\n{result.stderr}')
+        if elapsed < best:
+            best, imports = elapsed, parse_importtime(result.stderr)
+    return best, imports
+
+
+def main() -> None:
+    task_names = sys.argv[1:] or sorted(Collection.from_module(tasks).task_names)
+    for name, args in get_targets(task_names).items():
+        elapsed, (total, imports) = measure_target(args)
+        heaviest = ', '.join(f'{module} {us / 1000:.0f}ms' for us, module in imports[:TOP_IMPORTS])
+        print(f'{name:>20}: {elapsed * 1000:4.0f}ms, imports {total / 1000:4.0f}ms  {heaviest}')
+
+
+if __name__ == '__main__':
+    main()
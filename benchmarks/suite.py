@@ -0,0 +1,262 @@
+"""Benchmark suite on a synthetic corpus: end-to-end build and picture pipeline micro-benchmarks,
+compared against a JSON baseline with regression thresholds (relative slowdown per operation).
+
+Usage: python -m benchmarks.suite [--save] [--baseline PATH] [--threshold [NAME=]RATIO ...]
+                                  [--articles N] [--pictures M] [--rounds R]
+"""
+
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
+from json import dumps as json_dumps
+from json import loads as json_loads
+from os import environ
+from pathlib import Path
+from platform import python_version
+from shutil import copytree, rmtree
+from subprocess import DEVNULL, run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from pelican.contents import Article
+from pelican.settings import read_settings
+
+import utils.media
+import utils.staticfiles
+from benchmarks import PICTURE_BLOCK_PATTERN, SETTINGS_FILE, measure, setup_renderer
+from benchmarks.corpus import DEFAULT_ARTICLES, DEFAULT_PICTURES, generate_corpus
+from markup.processors.picture import Picture, PictureBlockProcessor, create_picture_element
+from pelicanconf import BUILD_CACHE_PATH, STATIC_BUILD_PATH
+from utils import get_processed_image_url
+from utils.datastructures import get_geodata_from_articles
+from utils.media import (
+    DEFAULT_BREAKPOINTS,
+    MAX_IMAGE_WIDTH,
+    ImageResizeSet,
+    get_image_resize_set,
+)
+from utils.staticfiles import generate_staticfiles_manifest
+
+BENCHMARKS_BASELINE = BUILD_CACHE_PATH / 'benchmarks.json'
+DEFAULT_ROUNDS = 5
+BUILD_ROUNDS = 2
+DEFAULT_THRESHOLD = 0.10
+THRESHOLDS = {'build': 0.25}  # subprocess and disk I/O, noisier
+STATIC_FILES = 40
+STATIC_FILE_SIZE = 64 * 1024
+
+BUILD_WORKSPACE_LINKS = ('assets', 'markup', 'utils', 'pelicanconf.py')
+# Cold and hermetic: no local sources, no caches, every output rendered
+BUILD_ENV = {
+    'IMAGES_SOURCE_PATH': '',
+    'IMGRESIZE_BACKEND': 'cloudflare',
+    'INCREMENTAL_BUILD': 'false',
+    'LOAD_CONTENT_CACHE': 'false',
+    'PROFILE_BUILD': 'false',
+}
+
+Results = dict[str, dict[str, float | int | str]]
+
+
+def load_articles(corpus_path: Path) -> list[Article]:
+    settings = read_settings(SETTINGS_FILE)
+    articles = []
+    for path in sorted(corpus_path.glob('*.md')):
+        header = path.read_text().split('---')[1]
+        metadata = dict(line.split(': ', 1) for line in header.strip().splitlines())
+        metadata.pop('date')  # only geodata relevant metadata is used
+        articles.append(Article('', metadata=metadata, settings=settings, source_path=str(path)))
+    return articles
+
+
+def clear_media_caches() -> None:
+    # Every round measures computing, not memoized results from the previous one
+    get_processed_image_url.__wrapped__.cache_clear()
+    get_image_resize_set.cache_clear()
+    utils.media._generate_image_path_signature.cache_clear()
+
+
+def run_build(corpus_path: Path, rounds: int) -> float:
+    repo_path = Path(__file__).resolve().parent.parent
+    with TemporaryDirectory() as workspace:
+        workspace = Path(workspace)
+        for name in BUILD_WORKSPACE_LINKS:
+            (workspace / name).symlink_to(repo_path / name)
+        copytree(corpus_path, workspace / 'articles')
+        command = [sys.executable, '-m', 'pelican', 'articles', '-s', 'pelicanconf.py', '-q']
+        best = float('inf')
+        for _ in range(rounds):
+            rmtree(workspace / 'dist', ignore_errors=True)
+            rmtree(workspace / '.cache', ignore_errors=True)
+            if STATIC_BUILD_PATH.is_dir():
+                copytree(STATIC_BUILD_PATH, workspace / STATIC_BUILD_PATH)
+            started = perf_counter()
+            run(command, cwd=workspace, env={**environ, **BUILD_ENV}, check=True, stdout=DEVNULL)
+            best = min(best, perf_counter() - started)
+    return best
+
+
+def run_staticfiles_manifest(rounds: int) -> float:
+    # Module paths point to a scratch directory, so the real build output is left alone
+    module = utils.staticfiles
+    paths = module.STATIC_BUILD_PATH, module.STATIC_MANIFEST, module.STATIC_MANIFEST_INDEX
+    with TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        module.STATIC_BUILD_PATH = scratch
+        module.STATIC_MANIFEST = scratch / 'manifest.json'
+        module.STATIC_MANIFEST_INDEX = scratch / 'staticfiles.json'
+        try:
+            for index in range(STATIC_FILES):
+                suffix = '.css' if index % 2 else '.js'
+                (scratch / f'bundle-{index}{suffix}').write_bytes(bytes([index]) * STATIC_FILE_SIZE)
+            return measure(lambda: generate_staticfiles_manifest(incremental=False), rounds)
+        finally:
+            module.STATIC_BUILD_PATH, module.STATIC_MANIFEST, module.STATIC_MANIFEST_INDEX = paths
+            module.get_staticfiles_manifest.cache_clear()
+
+
+def run_benchmarks(args: Namespace, corpus_path: Path) -> Results:
+    setup_renderer()
+    rounds = args.rounds
+    blocks = [
+        PictureBlockProcessor.REGEX.match(line).group(1)
+        for path in sorted(corpus_path.glob('*.md'))
+        for line in path.read_text().splitlines()
+        if PICTURE_BLOCK_PATTERN.match(line)
+    ]
+    pictures = [Picture.parse(block, index=index) for index, block in enumerate(blocks, 1)]
+    contexts = [picture.get_context() for picture in pictures]
+    articles = load_articles(corpus_path)
+    urls = [(picture.src, width) for picture in pictures for width in DEFAULT_BREAKPOINTS]
+
+    benchmarks: dict[str, tuple[Callable[[], object], int, str]] = {
+        'picture.parse': (
+            lambda: [Picture.parse(block, index=i) for i, block in enumerate(blocks, 1)],
+            len(blocks),
+            'picture',
+        ),
+        'picture.context': (
+            lambda: [picture.get_context() for picture in pictures],
+            len(pictures),
+            'picture',
+        ),
+        'image_resize_set': (
+            lambda: [
+                ImageResizeSet(
+                    picture.src, source_width=picture.dimensions.width, max_width=MAX_IMAGE_WIDTH
+                )
+                for picture in pictures
+            ],
+            len(pictures),
+            'picture',
+        ),
+        'get_processed_image_url': (
+            lambda: [get_processed_image_url(src, width=width, ext='webp') for src, width in urls],
+            len(urls),
+            'url',
+        ),
+        'create_picture_element': (
+            lambda: [create_picture_element(ctx) for ctx in contexts],
+            len(contexts),
+            'picture',
+        ),
+        'get_geodata_from_articles': (
+            lambda: get_geodata_from_articles(articles),
+            len(articles),
+            'article',
+        ),
+    }
+    results = {}
+    for name, (func, ops, unit) in benchmarks.items():
+        seconds = measure(func, rounds, setup=clear_media_caches) / ops
+        results[name] = {'seconds': seconds, 'ops': ops, 'unit': unit}
+    results['generate_staticfiles_manifest'] = {
+        'seconds': run_staticfiles_manifest(rounds) / STATIC_FILES,
+        'ops': STATIC_FILES,
+        'unit': 'file',
+    }
+    if not args.skip_build:
+        elapsed = run_build(corpus_path, min(rounds, BUILD_ROUNDS))
+        results['build'] = {
+            'seconds': elapsed / len(articles),
+            'ops': len(articles),
+            'unit': 'article',
+        }
+    return results
+
+
+def parse_thresholds(values: list[str]) -> tuple[float, dict[str, float]]:
+    default, thresholds = DEFAULT_THRESHOLD, dict(THRESHOLDS)
+    for value in values:
+        name, _, ratio = value.rpartition('=')
+        if name:
+            thresholds[name] = float(ratio)
+        else:
+            default = float(ratio)
+    return default, thresholds
+
+
+def compare(results: Results, baseline: dict, default: float, thresholds: dict) -> list[str]:
+    regressions = []
+    previous = baseline.get('results', {})
+    print(f'{"benchmark":<30} {"per op":>18} {"baseline":>12} {"change":>8}')
+    for name, result in results.items():
+        seconds = result['seconds']
+        per_op = f'{format_seconds(seconds)}/{result["unit"]}'
+        line = f'{name:<30} {per_op:>18}'
+        if name in previous:
+            change = seconds / previous[name]['seconds'] - 1
+            threshold = thresholds.get(name, default)
+            line += f' {format_seconds(previous[name]["seconds"]):>12} {change:>+8.1%}'
+            if change > threshold:
+                line += f'  REGRESSION (> {threshold:.0%})'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 0.1:
+        return f'{seconds:.2f} s'
+    if seconds >= 1e-4:
+        return f'{seconds * 1e3:.2f} ms'
+    return f'{seconds * 1e6:.2f} µs'
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Benchmark suite on a synthetic corpus')
+    parser.add_argument('--save', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--baseline', type=Path, default=BENCHMARKS_BASELINE)
+    parser.add_argument('--threshold', action='append', default=[], metavar='[NAME=]RATIO')
+    parser.add_argument('--articles', type=int, default=DEFAULT_ARTICLES)
+    parser.add_argument('--pictures', type=int, default=DEFAULT_PICTURES)
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument('--skip-build', action='store_true', help='micro-benchmarks only')
+    args = parser.parse_args()
+
+    corpus_params = {'articles': args.articles, 'pictures': args.pictures}
+    with TemporaryDirectory() as corpus_path:
+        corpus = generate_corpus(Path(corpus_path), **corpus_params)
+        print(f'{corpus.articles} articles, {corpus.pictures} pictures, python {python_version()}')
+        results = run_benchmarks(args, corpus.path)
+
+    try:
+        baseline = json_loads(args.baseline.read_text())
+    except (OSError, ValueError):
+        baseline = {}
+    if baseline and baseline.get('corpus') != corpus_params:
+        print(f'Baseline corpus {baseline.get("corpus")} differs, not compared')
+        baseline = {}
+    regressions = compare(results, baseline, *parse_thresholds(args.threshold))
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        data = {'corpus': corpus_params, 'python': python_version(), 'results': results}
+        args.baseline.write_text(json_dumps(data, indent=2))
+        print(f'Baseline saved to {args.baseline}')
+    if regressions:
+        raise SystemExit(f'Regressions: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Image URL generation: original per-call formatting vs precompiled `ImageURLBuilder`,
+and imgproxy path signing: re-keyed HMAC per URL vs copied pre-keyed state. Index cover options
+are checked to come out in imgproxy syntax.
+
+Usage: python -m benchmarks.urls
+"""
+
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+from hmac import new as hmac_new
+from os.path import splitext
+from typing import Any
+
+from benchmarks import iter_picture_blocks, measure
+from markup.processors.picture import Picture, PictureBlockProcessor
+from pelicanconf import (
+    IMGRESIZE_SERVICE_BASE_PATH,
+    IMGRESIZE_SERVICE_FQDN,
+    IMGSTORE_SERVICE_BASE_PATH,
+    IMGSTORE_SERVICE_FQDN,
+)
+from utils.media import (
+    DEFAULT_BREAKPOINTS,
+    DEFAULT_IMAGE_EXTENSION,
+    ImgproxyURLBuilder,
+    image_url_builder,
+)
+
+WIDTHS = tuple(sorted({*DEFAULT_BREAKPOINTS, *(bp * 2 for bp in DEFAULT_BREAKPOINTS), 1400}))
+COVER_OPTIONS = {'height': 300, 'fit': 'cover', 'gravity': 'bottom', 'crop': '0.8:0.8:top'}
+COVER_IMGPROXY_OPTIONS = 'w:300/h:300/rt:fill/c:0.8:0.8:no/g:so'
+
+
+def legacy_get_processed_image_url(
+    source_url_or_path: str, encode_source_url: bool = False, ext: str = 'auto', **options: Any
+) -> str:
+    # Implementation this benchmark compares against, kept verbatim
+    if not source_url_or_path:
+        return ''
+    img_base, img_ext = splitext(source_url_or_path)
+    if img_ext and len(img_ext) > 5:
+        img_base = f'{img_base}{img_ext}'
+        img_ext = None
+    source_url = img_base + (img_ext or DEFAULT_IMAGE_EXTENSION)
+    if not source_url.startswith('http'):
+        source_url = f'https://{IMGSTORE_SERVICE_FQDN}{IMGSTORE_SERVICE_BASE_PATH}{source_url}'
+    options |= {'format': ext, 'metadata': 'none'}
+    processing_options = ','.join(f'{k}={v}' for k, v in options.items() if v is not None)
+    return f'https://{IMGRESIZE_SERVICE_FQDN}{IMGRESIZE_SERVICE_BASE_PATH}{processing_options}/{source_url}'
+
+
+def legacy_generate_image_path_signature(path: str, key: bytes, salt: bytes) -> bytes:
+    digest = hmac_new(key, msg=salt + path.encode(), digestmod=sha256).digest()
+    return urlsafe_b64encode(digest).rstrip(b'=')
+
+
+def load_calls() -> list[tuple[str, dict]]:
+    calls = []
+    for block in iter_picture_blocks():
+        attrs = Picture.parse_attrs(PictureBlockProcessor.REGEX.match(block).group(1))
+        if not attrs.get('src'):
+            continue
+        options = {'q': 80}
+        if attrs.get('v'):
+            options = {'cachebuster': f'v{attrs["v"]}', **options}
+        calls.append((attrs['src'], options))
+    return calls
+
+
+def main() -> None:
+    calls = load_calls()
+
+    def run_legacy() -> list[str]:
+        return [
+            legacy_get_processed_image_url(src, width=width, ext='webp', **options)
+            for src, options in calls
+            for width in WIDTHS
+        ]
+
+    def run_build() -> list[str]:
+        return [
+            image_url_builder.build(src, width=width, ext='webp', **options)
+            for src, options in calls
+            for width in WIDTHS
+        ]
+
+    def run_batch() -> list[str]:
+        urls = []
+        for src, options in calls:
+            urls.extend(image_url_builder.build_widths(src, WIDTHS, ext='webp', **options))
+        return urls
+
+    expected = run_legacy()
+    if run_build() != expected or run_batch() != expected:
+        raise SystemExit('URL mismatch between legacy and builder implementations')
+
+    results = {'legacy': measure(run_legacy), 'build': measure(run_build)}
+    results['build_widths'] = measure(run_batch)
+    baseline = results['legacy']
+    print(f'{len(expected)} URLs ({len(calls)} sources × {len(WIDTHS)} widths), identical')
+    for name, elapsed in results.items():
+        per_url = elapsed / len(expected) * 1e9
+        print(f'{name:>14}: {per_url:8.0f} ns/url  ({baseline / elapsed:.2f}x)')
+
+    check_imgproxy_options(calls[0][0])
+    benchmark_signatures(calls)
+
+
+def check_imgproxy_options(src: str) -> None:
+    builder = ImgproxyURLBuilder(plain_sources=True)
+    urls = [
+        builder.build(src, width=300, ext='webp', **COVER_OPTIONS),
+        *builder.build_widths(src, [300], ext='webp', **COVER_OPTIONS),
+    ]
+    for url in urls:
+        options = url[len(builder.prefix) :].split('/plain/')[0].split('/', 2)[2]
+        if options != COVER_IMGPROXY_OPTIONS:
+            raise SystemExit(f'imgproxy cover options {options}, {COVER_IMGPROXY_OPTIONS} expected')
+    print(f'imgproxy cover options: {COVER_IMGPROXY_OPTIONS}')
+
+
+def benchmark_signatures(calls: list[tuple[str, dict]]) -> None:
+    import utils.media
+
+    key, salt = utils.media._KEY, utils.media._SALT
+    if not key:
+        print('IMGPROXY_KEY is not set, signatures are not benchmarked')
+        return
+    builder = ImgproxyURLBuilder()
+    paths = []
+    for src, options in calls:
+        for url in builder.build_widths(src, WIDTHS, ext='webp', **options):
+            paths.append(url[len(builder.prefix) :].split('/', 2)[2])
+    paths = [f'/{path}' for path in paths]
+    sign = utils.media._generate_image_path_signature
+    expected = [legacy_generate_image_path_signature(path, key, salt).decode() for path in paths]
+    sign.cache_clear()
+    if list(map(sign, paths)) != expected:
+        raise SystemExit('Signature mismatch between legacy and pre-keyed implementations')
+
+    results = {
+        'rekeyed': measure(
+            lambda: [legacy_generate_image_path_signature(p, key, salt) for p in paths]
+        ),
+        'copied': measure(lambda: list(map(sign.__wrapped__, paths))),
+        'cached': measure(lambda: list(map(sign, paths))),
+    }
+    baseline = results['rekeyed']
+    print(f'{len(paths)} imgproxy signatures, identical')
+    for name, elapsed in results.items():
+        per_url = elapsed / len(paths) * 1e9
+        print(f'{name:>14}: {per_url:8.0f} ns/sig  ({baseline / elapsed:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Local image variants rendering throughput, cold (empty cache) and warm, by worker count.
+
+Usage: IMAGES_SOURCE_PATH=... python -m benchmarks.variants [sources] [workers ...]
+"""
+
+import sys
+from os import cpu_count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks import iter_picture_blocks
+from markup.processors.picture import Picture, PictureBlockProcessor
+from pelicanconf import IMAGES_SOURCE_PATH
+from utils.imagevariants import ImageVariantRenderer
+from utils.media import ImageResizeSet, LocalImageURLBuilder, get_source_image_filename
+
+DEFAULT_SOURCES = 50
+
+
+def collect_variants(limit: int) -> dict:
+    import utils.media
+
+    builder = utils.media.image_url_builder = LocalImageURLBuilder()
+    sources = []
+    for block in iter_picture_blocks():
+        src = Picture.parse_attrs(PictureBlockProcessor.REGEX.match(block).group(1)).get('src')
+        if src and (IMAGES_SOURCE_PATH / get_source_image_filename(src)).is_file():
+            sources.append(src)
+        if len(sources) == limit:
+            break
+    for src in sources:
+        ImageResizeSet(src)
+    return builder.variants
+
+
+def main() -> None:
+    if IMAGES_SOURCE_PATH is None:
+        raise SystemExit('IMAGES_SOURCE_PATH is required')
+    args = [int(arg) for arg in sys.argv[1:]]
+    limit = args[0] if args else DEFAULT_SOURCES
+    worker_counts = args[1:] or sorted({1, cpu_count() or 1})
+    variants = collect_variants(limit)
+
+    for workers in worker_counts:
+        with TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir)
+            renderer = ImageVariantRenderer(
+                cache_path=temp_path / 'cache',
+                index_path=temp_path / 'index.json',
+                output_path=temp_path / 'output',
+            )
+            for run in ('cold', 'warm'):
+                stats = renderer.render(variants, max_workers=workers)
+                if stats.failed:
+                    raise SystemExit(f'{stats.failed} variants failed to render')
+                elapsed = stats.elapsed or 1e-9
+                print(
+                    f'{workers:>2} workers, {run}: {stats.variants} variants '
+                    f'of {stats.sources} sources in {stats.elapsed:.2f}s, '
+                    f'{stats.rendered} rendered ({stats.rendered / elapsed:.1f}/s, '
+                    f'{stats.rendered_bytes / elapsed / 1024 / 1024:.2f} MiB/s), '
+                    f'{stats.reused} reused'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Cache warmer throughput against a local stub server, with flaky responses to exercise retries.
+Resizer URLs of synthetic sources are requested, so no build output is needed.
+
+Usage: python -m benchmarks.warmup [concurrency ...]
+"""
+
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from math import ceil
+from threading import Thread
+
+from utils.media import DEFAULT_BREAKPOINTS, ImageURLBuilder
+from utils.warmup import run_warmup
+
+BODY = b'\0' * 32 * 1024
+FAILURE_EVERY = 50
+SAMPLE_SIZE = 5000
+CONCURRENCY = (1, 8, 32)
+
+
+def generate_urls(size: int = SAMPLE_SIZE) -> list[str]:
+    builder = ImageURLBuilder()
+    urls = []
+    for index in range(ceil(size / len(DEFAULT_BREAKPOINTS))):
+        urls.extend(builder.build_widths(f'synthetic/{index:05}.jpg', DEFAULT_BREAKPOINTS))
+    return urls[:size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    counter = count(1)
+
+    def do_GET(self) -> None:
+        if next(self.counter) % FAILURE_EVERY == 0:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/webp')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def main() -> None:
+    concurrency_levels = [int(arg) for arg in sys.argv[1:]] or CONCURRENCY
+    urls = generate_urls()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    origin = f'http://127.0.0.1:{server.server_port}'
+    try:
+        for concurrency in concurrency_levels:
+            report = run_warmup(urls, concurrency=concurrency, origin=origin, backoff=0.01)
+            if report.failed or report.succeeded != len(urls):
+                raise SystemExit(f'Warmup failed: {report.format()}')
+            print(f'concurrency {concurrency:>3}: {report.format()}')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+from datetime import date
+from hashlib import blake2b
+from io import StringIO
+from json import dumps as json_dumps
+from json import loads as json_loads
+from logging import getLogger
+from os import devnull
+from pathlib import Path
+from typing import Any
+
+from jinja2 import Template
+from jinja2.meta import find_referenced_templates
+from pelican.contents import Content
+from pelican.urlwrappers import URLWrapper
+from pelican.utils import sanitised_join
+from pelican.writers import FileOverwriteFailedError, Writer
+
+from pelicanconf import (
+    BUILD_CACHE_PATH,
+    IMGRESIZE_BACKEND,
+    INCREMENTAL_BUILD,
+    STATIC_ASSETS_PATH,
+    STATIC_BUILD_PATH,
+)
+from utils.imageprobe import image_dimensions_cache
+from utils.outputs import output_stats, write_if_changed
+from utils.placeholders import image_placeholder_cache
+
+logger = getLogger(__name__)
+
+BUILD_GRAPH_INDEX = BUILD_CACHE_PATH / 'outputs.json'
+DIGEST_SIZE = 16
+PARTIALS_PREFIX = 'partials/'  # rendered from Python helpers, not referenced by templates
+SITE_METADATA_EXCLUDES = frozenset({'modified'})  # file mtime, not used by templates
+# Plugin code: renderers, filters and globals templates call
+CODE_PATHS = (Path(__file__).parent, Path(__file__).parent.parent / 'utils')
+
+
+def _freeze(value: Any) -> Any:
+    # JSON-able, deterministic representation of template inputs
+    if value is None or isinstance(value, str | int | float | bool):
+        return value
+    if isinstance(value, Content):
+        return [value.source_path, value._content, _freeze(value.metadata)]
+    if isinstance(value, dict):
+        return sorted([str(key), _freeze(item)] for key, item in value.items())
+    if isinstance(value, list | tuple):
+        return [_freeze(item) for item in value]
+    if isinstance(value, set | frozenset):
+        return sorted(map(str, value))
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, URLWrapper | Path):
+        return str(value)
+    return type(value).__qualname__
+
+
+def get_digest(*values: Any) -> str:
+    data = json_dumps(_freeze(values), ensure_ascii=False, separators=(',', ':'))
+    return blake2b(data.encode(), digest_size=DIGEST_SIZE).hexdigest()
+
+
+def get_files_digest(paths: list[Path]) -> str:
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    for path in paths:
+        digest.update(str(path).encode())
+        digest.update(blake2b(path.read_bytes(), digest_size=DIGEST_SIZE).digest())
+    return digest.hexdigest()
+
+
+class BuildGraph:
+    """Outputs by what they were rendered from: `{output: [dependencies digest, content digest]}`.
+
+    Dependencies of an output are its template (with templates it extends/includes and partials),
+    settings, plugin code, static assets, image data, site-wide content metadata and its own
+    context, e.g. article content. If none of them changed, the output is not rendered again.
+    """
+
+    path: Path
+    _entries: dict[str, list[str]] | None = None
+    _written: set[str]
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._written = set()
+
+    @property
+    def entries(self) -> dict[str, list[str]]:
+        if self._entries is None:
+            try:
+                self._entries = json_loads(self.path.read_text())
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get_fresh_output(self, name: str, dependencies: str, path: Path) -> str | None:
+        entry = self.entries.get(name)
+        if not entry or entry[0] != dependencies:
+            return None
+        try:
+            content = path.read_bytes()
+        except OSError:
+            return None
+        if blake2b(content, digest_size=DIGEST_SIZE).hexdigest() != entry[1]:
+            return None
+        return content.decode()
+
+    def record(self, name: str, dependencies: str, content: bytes) -> None:
+        self.entries[name] = [dependencies, blake2b(content, digest_size=DIGEST_SIZE).hexdigest()]
+        self._written.add(name)
+
+    def save(self) -> None:
+        if not self._written:
+            return
+        # Outputs not written by this build are gone (or never were ours)
+        entries = {name: self.entries[name] for name in sorted(self._written)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix('.tmp')
+        temp_path.write_text(json_dumps(entries))
+        temp_path.replace(self.path)
+        self._entries = entries
+        self._written = set()
+
+
+build_graph = BuildGraph(BUILD_GRAPH_INDEX)
+
+
+class OutputFile(StringIO):
+    """Buffered output, written on close only if its content differs from existing file."""
+
+    def __init__(self, writer: 'IncrementalWriter', path: str, encoding: str):
+        super().__init__()
+        self.writer = writer
+        self.path = path
+        self.output_encoding = encoding
+
+    def close(self) -> None:
+        if not self.closed:
+            self.writer.finalize_output(self.path, self.getvalue().encode(self.output_encoding))
+        super().close()
+
+
+class IncrementalTemplate:
+    """Template proxy: renders only if output dependencies changed since it was written."""
+
+    def __init__(self, template: Template, writer: 'IncrementalWriter', context: dict):
+        self.template = template
+        self.writer = writer
+        self.context = context
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.template, name)
+
+    def render(self, localcontext: dict) -> str:
+        name = localcontext['output_file']
+        dependencies = self.writer.get_dependencies(self.template, self.context, localcontext)
+        path = sanitised_join(self.writer.output_path, name)
+        self.writer.dependencies[path] = (name, dependencies)
+        if self.writer.selective:
+            output = build_graph.get_fresh_output(name, dependencies, Path(path))
+            if output is not None:
+                self.writer.skipped.add(path)
+                return output
+        return self.template.render(localcontext)
+
+
+class IncrementalWriter(Writer):
+    """Writer skipping identical writes and, with `INCREMENTAL_BUILD`, rendering of outputs
+    whose dependencies are unchanged. Local image variants are registered while rendering
+    templates, so outputs are always rendered with that backend."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.selective = INCREMENTAL_BUILD and IMGRESIZE_BACKEND != 'local'
+        self.dependencies: dict[str, tuple[str, str]] = {}
+        self.skipped: set[str] = set()
+        self._global_digest: str | None = None
+        self._template_digests: dict[str, str] = {}
+
+    def write_file(self, name: str, template: Template, context: dict, *args, **kwargs) -> None:
+        template = IncrementalTemplate(template, self, context)
+        return super().write_file(name, template, context, *args, **kwargs)
+
+    def _open_w(self, filename: str, encoding: str, override: bool = False) -> Any:
+        # Same bookkeeping as `Writer._open_w`, but returning a buffered skip-identical file
+        if filename in self._overridden_files:
+            if override:
+                raise FileOverwriteFailedError(
+                    f'Failed to overwrite "{filename}" a second time (was previously overwritten)'
+                )
+            logger.info('Skipping "%s", not overwriting', filename)
+            return open(devnull, 'w', encoding=encoding)  # noqa: SIM115
+        if filename in self._written_files and not override:
+            raise FileOverwriteFailedError(
+                f'Failed to overwrite "{filename}" as Pelican has already written to it '
+                'previously (set `override=True` if intended)'
+            )
+        if override:
+            self._overridden_files.add(filename)
+        self._written_files.add(filename)
+        return OutputFile(self, filename, encoding)
+
+    def finalize_output(self, path: str, content: bytes) -> None:
+        if path in self.skipped:
+            output_stats.record('skipped')
+        else:
+            write_if_changed(Path(path), content)
+        if path in self.dependencies:
+            build_graph.record(*self.dependencies.pop(path), content)
+
+    def get_dependencies(self, template: Template, context: dict, localcontext: dict) -> str:
+        # Own context: everything passed on top of the global one, e.g. `article`
+        own_context = {
+            key: value
+            for key, value in localcontext.items()
+            if key not in context or context[key] is not value
+        }
+        return get_digest(
+            self.get_global_digest(context),
+            self.get_template_digest(template),
+            own_context,
+        )
+
+    def get_global_digest(self, context: dict) -> str:
+        if self._global_digest is None:
+            static_files = [
+                *(path for path in sorted(STATIC_ASSETS_PATH.rglob('*')) if path.is_file()),
+                *(path for path in sorted(STATIC_BUILD_PATH.glob('*')) if path.is_file()),
+            ]
+            code_files = [
+                path for code_path in CODE_PATHS for path in sorted(code_path.rglob('*.py'))
+            ]
+            site_content = [
+                [
+                    content.source_path,
+                    content.url,
+                    {
+                        key: value
+                        for key, value in content.metadata.items()
+                        if key not in SITE_METADATA_EXCLUDES
+                    },
+                ]
+                for key in ('articles', 'hidden_articles', 'pages', 'hidden_pages')
+                for content in context.get(key) or ()
+            ]
+            image_data = [
+                {path: entry[2] for path, entry in image_placeholder_cache.files.items()},
+                image_dimensions_cache.entries,
+            ]
+            self._global_digest = get_digest(
+                self.settings,
+                get_files_digest(code_files),
+                get_files_digest(static_files),
+                site_content,
+                image_data,
+            )
+        return self._global_digest
+
+    def get_template_digest(self, template: Template) -> str:
+        if template.name not in self._template_digests:
+            env = template.environment
+            names = {template.name, *env.list_templates(filter_func=self._is_partial)}
+            sources = {}
+            while names:
+                name = names.pop()
+                source, _, _ = env.loader.get_source(env, name)
+                sources[name] = source
+                referenced = set(find_referenced_templates(env.parse(source)))
+                if None in referenced:  # dynamic template name, depends on any
+                    referenced = set(env.list_templates())
+                names |= referenced - sources.keys() - {None}
+            self._template_digests[template.name] = get_digest(sources)
+        return self._template_digests[template.name]
+
+    @staticmethod
+    def _is_partial(name: str) -> bool:
+        return name.startswith(PARTIALS_PREFIX)
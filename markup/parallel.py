@@ -0,0 +1,145 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from logging import getLogger
+from multiprocessing import get_all_start_methods, get_context
+from os import cpu_count
+from os.path import abspath, join
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple
+from weakref import WeakSet
+
+from markdown import Markdown
+from pelican import ArticlesGenerator
+from pelican.readers import MarkdownReader
+from pelican.utils import file_suffix, pelican_open
+
+from markup.processors.picture import find_picture_sources
+from utils import get_source_image_dimensions
+from utils.fragments import picture_fragments_cache
+from utils.media import image_url_builder
+from utils.variants import width_plan_stats
+
+logger = getLogger(__name__)
+
+
+class RenderedMarkdown(NamedTuple):
+    content: str
+    meta: dict | None
+    variants: list  # local image variants registered while rendering, see `LocalImageURLBuilder`
+    width_plan_stats: dict
+    fragments: list  # picture fragments cache entries used and set, see `FragmentCache.export`
+
+
+# Articles converted ahead by workers, by absolute source path; consumed once by the reader
+_rendered: dict[str, RenderedMarkdown] = {}
+_prerendered_generators: WeakSet = WeakSet()
+
+
+def render_markdown(path: str, markdown_settings: dict) -> RenderedMarkdown:
+    # Runs in workers: same conversion as `MarkdownReader.read`, plus side state to merge back
+    variants = getattr(image_url_builder, 'variants', {})
+    variants_count = len(variants)
+    stats = width_plan_stats.as_dict()
+    journal_size = picture_fragments_cache.journal_size
+
+    md = Markdown(**markdown_settings)
+    with pelican_open(path) as text:
+        content = md.convert(text)
+
+    stats_delta = {
+        key: value if key == 'worst_overhead' else value - stats[key]
+        for key, value in width_plan_stats.as_dict().items()
+    }
+    new_variants = list(islice(variants.items(), variants_count, None))
+    fragments = picture_fragments_cache.export(journal_size)
+    meta = getattr(md, 'Meta', None)
+    return RenderedMarkdown(content, meta, new_variants, stats_delta, fragments)
+
+
+class PrerenderedMarkdownReader(MarkdownReader):
+    """Markdown reader using articles converted ahead by `prerender_articles`, if any."""
+
+    def read(self, source_path: str) -> tuple[str, dict]:
+        rendered = _rendered.pop(source_path, None)
+        if rendered is None:
+            return super().read(source_path)
+        self._source_path = source_path
+        self._md = Markdown(**self.settings['MARKDOWN'])
+        metadata = self._parse_metadata(rendered.meta) if rendered.meta is not None else {}
+        return rendered.content, metadata
+
+
+def _merge_worker_state(rendered: RenderedMarkdown) -> None:
+    variants = getattr(image_url_builder, 'variants', None)
+    if variants is not None:
+        for path, variant in rendered.variants:
+            variants.setdefault(path, variant)
+    width_plan_stats.merge(rendered.width_plan_stats)
+    picture_fragments_cache.merge(rendered.fragments)
+
+
+def _get_pool_context():
+    # Workers must inherit state prepared before forking (placeholders, dimensions cache)
+    return get_context('fork') if 'fork' in get_all_start_methods() else None
+
+
+def _get_article_paths(generator: ArticlesGenerator) -> Iterable[str]:
+    settings = generator.settings
+    files = generator.get_files(settings['ARTICLE_PATHS'], exclude=settings['ARTICLE_EXCLUDES'])
+    for path in files:
+        if file_suffix(path) not in MarkdownReader.file_extensions:
+            continue
+        source_path = abspath(join(generator.path, path))
+        if generator.get_cached_data(path, None) is not None:
+            continue
+        if generator.readers.get_cached_data(source_path, None) is not None:
+            continue
+        yield source_path
+
+
+def use_prerendered_markdown_reader(reader_classes: dict) -> None:
+    for fmt, reader_class in reader_classes.items():
+        if reader_class is MarkdownReader:
+            reader_classes[fmt] = PrerenderedMarkdownReader
+
+
+def prerender_articles(generator: ArticlesGenerator, max_workers: int | None = None) -> int:
+    # Preread signal is sent for every article, conversion runs for the first one only
+    if generator in _prerendered_generators:
+        return 0
+    _prerendered_generators.add(generator)
+    started = perf_counter()
+    paths = sorted(_get_article_paths(generator))
+    if not paths:
+        return 0
+
+    # Warm up in-process caches workers read from, so nothing is probed in workers only
+    for path in paths:
+        for src in find_picture_sources(Path(path).read_text()):
+            get_source_image_dimensions(src)
+
+    markdown_settings = generator.settings['MARKDOWN']
+    max_workers = max_workers or cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_get_pool_context()) as executor:
+        futures = {
+            path: executor.submit(render_markdown, path, markdown_settings) for path in paths
+        }
+        for path, future in futures.items():
+            try:
+                rendered = future.result()
+            except Exception as exc:
+                # Reader converts it again serially, reporting the error the usual way
+                logger.warning('Could not prerender %s: %s', path, exc)
+                continue
+            _merge_worker_state(rendered)
+            _rendered[path] = rendered
+
+    logger.info(
+        'Prerendered %d articles with %d workers in %.2fs',
+        len(_rendered),
+        max_workers,
+        perf_counter() - started,
+    )
+    return len(_rendered)
@@ -1,25 +1,44 @@
-from collections import defaultdict, deque
 from collections.abc import Iterable, Iterator
 from contextlib import suppress
-from contextvars import ContextVar
-from html.parser import HTMLParser
-from re import Pattern
+from functools import cache
+from html import unescape as html_unescape
+from pathlib import Path
+from re import MULTILINE, VERBOSE, Pattern
 from re import compile as re_compile
-from typing import Any
-from xml.etree.ElementTree import Element
+from typing import Any, NamedTuple
+from uuid import uuid4
+from xml.etree.ElementTree import Element, SubElement
 from xml.etree.ElementTree import fromstring as xml_from_string
 
+from jinja2.filters import do_mark_safe
+from markdown import Markdown
 from markdown.blockprocessors import BlockProcessor
 from markdown.extensions import Extension
+from markdown.serializers import to_html_string
+from markdown.treeprocessors import Treeprocessor
 
-from pelicanconf import AUTHOR
+import utils.media
+import utils.variants
+from pelicanconf import AUTHOR, IMGRESIZE_BACKEND
 from utils import (
     ImageDimensions,
+    ImageResize,
     ImageResizeSet,
     StrEnum,
+    get_image_placeholder,
+    get_image_resize_set,
     get_processed_image_url,
+    get_source_image_dimensions,
     render_template_partial,
 )
+from utils.fragments import (
+    ElementData,
+    element_from_data,
+    element_to_data,
+    get_fragments_version,
+    picture_fragments_cache,
+)
+from utils.profiling import profiled
 
 PICTURE_DEFAULT_RATIO = 1.777  # 16:9
 PICTURE_RATIO_PRECISION = 3
@@ -29,29 +48,32 @@ PICTURE_JSON_LD_BASE = {
     'creator': {'@type': 'Person', 'name': AUTHOR},
 }
 PICTURE_JSON_LD_MAX_ITEMS = 10
-
-PictureContext = defaultdict[int, deque['Picture']]
-_picture_processor_context_ref: ContextVar[PictureContext | None] = ContextVar(
-    'picture_processor_context', default=None
-)
+PICTURE_REGISTRY_METADATA_KEY = 'pictures'
 
 
-def get_picture_context() -> PictureContext:
-    ctx = _picture_processor_context_ref.get()
-    if not ctx:
-        ctx = defaultdict(deque)
-        _picture_processor_context_ref.set(ctx)
-    return ctx
+class Picture:
+    """Parsed `[pic key=value flag]` block: attributes plus computed dimensions and resizes."""
 
+    __slots__ = ('attrs', 'src', 'index', 'ratio', 'dimensions', 'resizes')
 
-class Picture(HTMLParser):
     TAG: str = 'pic'
-    index: int = 1
-    ratio: float = PICTURE_DEFAULT_RATIO
+    # Same attribute rules as `html.parser`: quoted/unquoted values, valueless flags
+    ATTRIBUTE_REGEX: Pattern = re_compile(
+        r"""
+        (?P<name>[^\s=\]/][^\s/=\]]*)  # attribute name, e.g. src
+        (?:\s*=+\s*
+            (?P<value>'[^']*'|"[^"]*"|(?!['"])[^\s\]]*)  # optional value, e.g. "a/b.jpg" or 5|3
+        )?
+        """,
+        flags=VERBOSE,
+    )
+
+    attrs: dict[str, str | None]
+    src: str | None
+    index: int
+    ratio: float
     dimensions: ImageDimensions
     resizes: ImageResizeSet
-    attrs: dict[str, str]
-    src: str
 
     class Loading(StrEnum):
         LAZY = 'lazy'
@@ -61,17 +83,16 @@ class Picture(HTMLParser):
         LANDSCAPE = 'landscape'
         PORTRAIT = 'portrait'
 
-    def handle_starttag(self, tag: str, attrs: list[tuple[str, str]]) -> None:
-        self.attrs = dict(attrs) if tag == self.TAG else {}
-
-    def feed(self, data: str) -> None:
-        super().feed(data)
-        self.src = self.attrs.get('src')
+    def __init__(self, attrs: dict[str, str | None], index: int = 1):
+        self.attrs = attrs
+        self.src = attrs.get('src')
+        self.index = index
+        self.ratio = PICTURE_DEFAULT_RATIO
         if not self.src:
             return
 
-        # Extract dimensions from filename or create fake from predefined ratio
-        dimensions = ImageDimensions.extract_from_filename(self.src)
+        # Extract dimensions from filename or local source image, or create fake from ratio
+        dimensions = self.find_dimensions(self.src)
         if dimensions:
             ratio = round(dimensions.width / dimensions.height, PICTURE_RATIO_PRECISION)
         else:
@@ -83,6 +104,30 @@ class Picture(HTMLParser):
         # Create image resizes set
         self.resizes = self.get_resizes()
 
+    @staticmethod
+    def find_dimensions(src: str) -> ImageDimensions | None:
+        return ImageDimensions.extract_from_filename(src) or get_source_image_dimensions(src)
+
+    @classmethod
+    def parse(cls, block: str, index: int = 1) -> 'Picture':
+        return cls(cls.parse_attrs(block), index=index)
+
+    @classmethod
+    def parse_attrs(cls, block: str) -> dict[str, str | None]:
+        # `block` is `pic key=value flag` part of `[pic key=value flag]`
+        name, *rest = block.split(None, 1)
+        if name.lower() != cls.TAG or not rest:
+            return {}
+        attrs = {}
+        for match in cls.ATTRIBUTE_REGEX.finditer(rest[0]):
+            name, value = match.group('name', 'value')
+            if value and value[0] == value[-1] and value[0] in {'"', "'"}:
+                value = value[1:-1]
+            if value and '&' in value:
+                value = html_unescape(value)
+            attrs[name.lower()] = value
+        return attrs
+
     def _extract_ratio_value(self, precision: int = PICTURE_RATIO_PRECISION) -> float:
         ratio = self.attrs.get('ratio')
         if ratio and ':' in ratio:
@@ -97,15 +142,11 @@ class Picture(HTMLParser):
             return round(1 / PICTURE_DEFAULT_RATIO, precision)
         return PICTURE_DEFAULT_RATIO
 
-    def create_element(self) -> Element:
-        rendered = render_template_partial('picture', self.get_context())
-        return xml_from_string(rendered)
-
     def get_resizes(self) -> ImageResizeSet:
         processing_options = {}
 
         # Crop before processing
-        crop_params = self.attrs.get('crop', '').split(':')[:3]
+        crop_params = (self.attrs.get('crop') or '').split(':')[:3]
         if len(crop_params) == 2:
             width, height = crop_params
             processing_options.update(crop=f'{width}:{height}:nowe')
@@ -118,12 +159,26 @@ class Picture(HTMLParser):
         if version:
             processing_options.update(cachebuster=f'v{version}')
 
-        return ImageResizeSet(self.src, source_width=self.dimensions.width, **processing_options)
+        return get_image_resize_set(
+            self.src, source_width=self.dimensions.width, **processing_options
+        )
+
+    @property
+    def eager(self) -> bool:
+        return self.attrs.get('lazy') == 'false' or 'eager' in self.attrs
+
+    @property
+    def json_ld_url(self) -> str:
+        return self.resizes.get_fallback(max_width=1000, ext='jpg', q=80)
+
+    @property
+    def preload_sources(self) -> Iterable[ImageResize | dict]:
+        return self.resizes.sources
 
     def get_context(self) -> dict:
-        eager = self.attrs.get('lazy') == 'false' or 'eager' in self.attrs
+        eager = self.eager
         fetch_priority = 'high' if self.index == 1 and eager else 'auto'
-        span, offset = self.attrs.get('grid', '|').split('|')
+        span, offset = (self.attrs.get('grid') or '|').split('|')
         span = self.attrs.get('w') or span
         offset = self.attrs.get('x') or offset
         return {
@@ -136,6 +191,7 @@ class Picture(HTMLParser):
             'fetch_priority': fetch_priority,
             'dimensions': self.dimensions,
             'ratio': self.ratio,
+            'placeholder': get_image_placeholder(self.src),
             'alt': self.html_alt,
             'caption': self.html_caption,
             'span': span or '*',
@@ -162,41 +218,250 @@ class Picture(HTMLParser):
         for index, picture in enumerate(pictures):
             if max_items is not None and index >= max_items:
                 break
-            url = picture.resizes.get_fallback(max_width=1000, ext='jpg', q=80)
-            yield {**PICTURE_JSON_LD_BASE, 'contentUrl': url}
+            yield {**PICTURE_JSON_LD_BASE, 'contentUrl': picture.json_ld_url}
+
+
+class PictureFragment(NamedTuple):
+    element: ElementData  # built `<figure>`, see `create_picture_element`
+    json_ld_url: str
+    preload_sources: list[dict]  # eager pictures only
+
+    @classmethod
+    def from_picture(cls, picture: Picture, element: Element) -> 'PictureFragment':
+        preload_sources = [
+            {'srcset': list(source.srcset), 'media_query_full': source.media_query_full}
+            for source in (picture.preload_sources if picture.eager else ())
+        ]
+        return cls(element_to_data(element), picture.json_ld_url, preload_sources)
+
+
+class CachedPicture(Picture):
+    """Picture restored from fragments cache: attributes and rendered parts, nothing computed."""
+
+    __slots__ = ('fragment',)
+
+    fragment: PictureFragment
+
+    def __init__(self, attrs: dict[str, str | None], fragment: PictureFragment, index: int = 1):
+        self.attrs = attrs
+        self.src = attrs.get('src')
+        self.index = index
+        self.fragment = fragment
+
+    @property
+    def json_ld_url(self) -> str:
+        return self.fragment.json_ld_url
+
+    @property
+    def preload_sources(self) -> Iterable[ImageResize | dict]:
+        return self.fragment.preload_sources
+
+
+class PictureRegistry:
+    """Pictures of a single Markdown document, in order of appearance."""
+
+    __slots__ = ('pictures',)
+
+    pictures: list[Picture]
+
+    def __init__(self):
+        self.pictures = []
+
+    def __iter__(self) -> Iterator[Picture]:
+        return iter(self.pictures)
+
+    def __len__(self) -> int:
+        return len(self.pictures)
+
+    @property
+    def next_index(self) -> int:
+        return len(self.pictures) + 1
+
+    def register(self, picture: Picture) -> Picture:
+        self.pictures.append(picture)
+        return picture
+
+    @property
+    def lcp_picture(self) -> Picture | None:
+        # First eagerly loaded picture is the likely Largest Contentful Paint candidate
+        return next((picture for picture in self.pictures if picture.eager), None)
+
+    def create_json_ld(self, max_items: int | None = PICTURE_JSON_LD_MAX_ITEMS) -> list[dict]:
+        return list(Picture.create_json_ld(self.pictures, max_items=max_items))
+
+
+def get_picture_registry(md: Markdown) -> PictureRegistry:
+    registry = getattr(md, 'pictures', None)
+    if registry is None:
+        registry = md.pictures = PictureRegistry()
+    return registry
+
+
+def create_picture_element(ctx: dict) -> Element:
+    # Only source of `[pic]` markup, whitespace text/tails as the template it replaced rendered
+    figure = Element(
+        'figure',
+        {
+            'data-src': ctx['src'],
+            'data-index': str(ctx['index'] or 0),
+            'data-span': ctx['span'],
+            'data-offset': ctx['offset'] or '0',
+            'id': ctx['id'] or str(uuid4()),
+        },
+    )
+    figure.text = '\n'
+    create_picture_tag_element(ctx, figure)
+    if ctx['caption']:
+        figure.append(xml_from_string(f'<figcaption>{ctx["caption"]}</figcaption>'))
+    return figure
+
+
+def create_picture_tag_element(ctx: dict, parent: Element | None = None) -> Element:
+    style = f'--ratio: {ctx["ratio"] or 1};'
+    if ctx.get('placeholder'):
+        style = f'{style} --placeholder: url({ctx["placeholder"]});'
+    if parent is None:
+        picture = Element('picture', {'style': style})
+    else:
+        picture = SubElement(parent, 'picture', {'style': style})
+    picture.text = '\n    '
+    source = None
+    for resize in ctx['sources']:
+        source = SubElement(
+            picture,
+            'source',
+            {'srcset': ', '.join(resize.srcset), 'media': resize.media_query},
+        )
+        source.tail = '\n    '
+    if source is None:
+        picture.text = '\n  '
+    else:
+        source.tail = '\n  '
+    width, height = ctx['dimensions'] or (0, 0)
+    img = SubElement(
+        picture,
+        'img',
+        {
+            'src': ctx['fallback'],
+            'alt': ctx['alt'],
+            'loading': str(ctx['loading'] or Picture.Loading.LAZY),
+            'fetchpriority': ctx['fetch_priority'] or 'auto',
+            'width': str(width),
+            'height': str(height),
+            'onload': "this.dataset.loaded = 'true'",
+        },
+    )
+    img.tail = '\n'
+    return picture
+
+
+@cache
+def get_picture_fragments_version() -> str:
+    modules = (__file__, utils.media.__file__, utils.variants.__file__)
+    return get_fragments_version(map(Path, modules))
+
+
+def get_picture_fragment_key(attrs: dict[str, str | None], index: int) -> str:
+    src = attrs['src']
+    return picture_fragments_cache.get_key(
+        get_picture_fragments_version(),
+        attrs,
+        index,
+        Picture.find_dimensions(src),
+        get_image_placeholder(src),
+    )
+
+
+def create_registered_picture_element(
+    registry: PictureRegistry, attrs: dict[str, str | None]
+) -> Element:
+    # Local resize backend registers variants while building URLs, so nothing is reused then
+    index = registry.next_index
+    if not picture_fragments_cache.enabled or IMGRESIZE_BACKEND == 'local':
+        picture = registry.register(Picture(attrs, index=index))
+        return create_picture_element(picture.get_context())
+
+    key = get_picture_fragment_key(attrs, index)
+    entry = picture_fragments_cache.get(key)
+    if entry is not None:
+        fragment = PictureFragment(*entry)
+        registry.register(CachedPicture(attrs, fragment, index=index))
+        return element_from_data(fragment.element)
+
+    picture = registry.register(Picture(attrs, index=index))
+    element = create_picture_element(picture.get_context())
+    picture_fragments_cache.set(key, list(PictureFragment.from_picture(picture, element)))
+    return element
 
 
 class PictureBlockProcessor(BlockProcessor):
-    REGEX: Pattern = re_compile(r'\[pic(.+)]')
-    _count: int = 0
+    REGEX: Pattern = re_compile(r'\[(pic.+)]')
+    SOURCE_REGEX: Pattern = re_compile(r'^\[(pic.+)]', flags=MULTILINE)
 
     def test(self, parent: Element, block: str) -> bool:
         return bool(self.REGEX.match(block))
 
+    @profiled('processor:PictureBlockProcessor.run')
     def run(self, parent: Element, blocks: list[str]) -> bool:
-        block = blocks.pop(0).replace('[', '<').replace(']', '>')
-        picture = Picture()
-        picture.feed(block)
-        if not picture.src:
+        match = self.REGEX.match(blocks.pop(0))
+        attrs = Picture.parse_attrs(match.group(1))
+        if not attrs.get('src'):
             return False
 
-        self._count += 1
-        picture.index = self._count
-        parent.append(picture.create_element())
-        picture.close()
-        get_picture_context()[id(self)].append(picture)
+        registry = get_picture_registry(self.parser.md)
+        parent.append(create_registered_picture_element(registry, attrs))
         return True
 
 
+class PictureRegistryTreeprocessor(Treeprocessor):
+    """Expose document pictures as metadata, so Pelican passes them on to the content object."""
+
+    def run(self, root: Element) -> None:
+        registry = get_picture_registry(self.md)
+        meta = getattr(self.md, 'Meta', None)
+        if registry and meta is not None:
+            meta[PICTURE_REGISTRY_METADATA_KEY] = [registry]
+
+
+def find_picture_sources(text: str) -> Iterator[str]:
+    for match in PictureBlockProcessor.SOURCE_REGEX.finditer(text):
+        src = Picture.parse_attrs(match.group(1)).get('src')
+        if src:
+            yield src
+
+
 class PictureExtension(Extension):
-    def extendMarkdown(self, md) -> None:
+    md: Markdown
+
+    def extendMarkdown(self, md: Markdown) -> None:
+        self.md = md
+        md.registerExtension(self)
+        self.reset()
         md.parser.blockprocessors.register(PictureBlockProcessor(md.parser), 'pic', 999)
+        md.treeprocessors.register(PictureRegistryTreeprocessor(md), 'pic_registry', 0)
+
+    def reset(self) -> None:
+        # New registry instead of clearing: previous one may be referenced by parsed metadata
+        self.md.pictures = PictureRegistry()
 
 
 def makeExtension(**kwargs) -> PictureExtension:  # noqa
     return PictureExtension(**kwargs)
 
 
+def get_picture_tag_resizes(
+    src: str, width: int, ratio: float = PICTURE_DEFAULT_RATIO, **kwargs: Any
+) -> tuple[tuple[ImageResize, ...], str]:
+    height = int(width * ratio)
+    srcset = [
+        get_processed_image_url(src, width=width, height=height, **kwargs),
+        get_processed_image_url(src, width=width * 2, height=height * 2, **kwargs) + ' 2x',
+    ]
+    source = ImageResize(width, srcset, condition='any')
+    fallback = get_processed_image_url(src, width=width, height=height, ext='jpg', **kwargs)
+    return (source,), fallback
+
+
 # TODO: refactor this block
 def render_picture_tag(
     src: str,
@@ -207,22 +472,31 @@ def render_picture_tag(
     alt: str = '',
     **kwargs: Any,
 ) -> str:
-    height = int(width * ratio)
-    source = {
-        'srcset': [
-            get_processed_image_url(src, width=width, height=height, **kwargs),
-            get_processed_image_url(src, width=width * 2, height=height * 2, **kwargs) + ' 2x',
-        ],
-        'media_query': '(min-width: 0px)',
-    }
-    fallback = get_processed_image_url(src, width=width, height=height, ext='jpg', **kwargs)
+    sources, fallback = get_picture_tag_resizes(src, width, ratio=ratio, **kwargs)
     ctx = {
-        'sources': (source,),
+        'sources': sources,
         'fallback': fallback,
         'loading': loading,
         'fetch_priority': fetch_priority,
         'ratio': ratio,
-        'dimensions': (width, height),
+        'dimensions': (width, int(width * ratio)),
         'alt': alt,
+        'placeholder': get_image_placeholder(src),
     }
-    return render_template_partial('picture-tag', ctx)
+    return do_mark_safe(to_html_string(create_picture_tag_element(ctx)))
+
+
+def render_image_preload(sources: Iterable[ImageResize | dict] | None) -> str:
+    # `<link rel=preload>` per `<source>`, with media narrowed to the range it is picked for
+    if not sources:
+        return ''
+    return render_template_partial('preload', {'sources': sources})
+
+
+def render_picture_tag_preload(
+    src: str | None, width: int, ratio: float = PICTURE_DEFAULT_RATIO, **kwargs: Any
+) -> str:
+    if not src:
+        return ''
+    sources, _ = get_picture_tag_resizes(src, width, ratio=ratio, **kwargs)
+    return render_image_preload(sources)
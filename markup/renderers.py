@@ -1,20 +1,58 @@
-from json import dumps as json_dumps
+from logging import getLogger
+from pathlib import Path
 from random import randint
+from time import perf_counter
 from uuid import uuid4
+from weakref import WeakSet
 
 from jinja2 import Environment
 from pelican import ArticlesGenerator, signals
 from pelican.contents import Article
+from pelican.readers import Readers
 
 from markup import renderer_ref
-from markup.processors.picture import Picture, get_picture_context, render_picture_tag
-from pelicanconf import DATAFILES_PATH
+from markup.incremental import IncrementalWriter, build_graph
+from markup.parallel import prerender_articles, use_prerendered_markdown_reader
+from markup.processors.picture import (
+    PICTURE_REGISTRY_METADATA_KEY,
+    PictureRegistry,
+    find_picture_sources,
+    render_image_preload,
+    render_picture_tag,
+    render_picture_tag_preload,
+)
+from pelicanconf import (
+    DATAFILES_PATH,
+    IMAGE_PLACEHOLDERS,
+    IMGRESIZE_BACKEND,
+    IMGRESIZE_MAX_VARIANTS,
+    NEARBY_ARTICLES,
+    OUTPUT_PATH,
+    PARALLEL_RENDERING,
+    PRECOMPRESS,
+    RENDERING_WORKERS,
+)
 from utils.datastructures import (
     dict_to_css_variables,
     get_geodata_from_articles,
     get_geodata_from_dataset,
 )
-from utils.media import get_processed_image_url
+from utils.fragments import picture_fragments_cache
+from utils.geoencoding import write_geodata
+from utils.geotiles import geotile_stats, write_geotiles
+from utils.imagemanifest import image_url_manifest
+from utils.imageprobe import image_dimensions_cache
+from utils.imagevariants import render_image_variants
+from utils.media import get_media_cache_info, get_processed_image_url, image_url_builder
+from utils.nearby import set_articles_nearby
+from utils.outputs import output_stats
+from utils.placeholders import (
+    get_image_placeholder,
+    image_placeholder_cache,
+    prepare_image_placeholders,
+)
+from utils.precompress import precompress_output as precompress_output_files
+from utils.profiling import PROFILE_TOP, profile_markdown_readers, profiled, profiler
 from utils.staticfiles import get_static_url, inline_static_assets
 from utils.templating import (
     format_article_date_period,
@@ -23,6 +61,7 @@ from utils.templating import (
     wrap_bullets,
 )
 from utils.url import get_datafile_url, qualify_url
+from utils.variants import width_plan_stats
 
 GLOBALS = {
     'random': randint,
@@ -31,7 +70,10 @@ GLOBALS = {
     'api': get_datafile_url,
     'static_inline': inline_static_assets,
     'picture': render_picture_tag,
+    'preload': render_image_preload,
+    'picture_preload': render_picture_tag_preload,
     'img': get_processed_image_url,
+    'image_placeholder': get_image_placeholder,
     'pagemeta': render_page_metadata,
     'colors': get_articles_colors_list,
     'article_date_period': format_article_date_period,
@@ -43,10 +85,17 @@ FILTERS = {
     'bulletify': wrap_bullets,
 }
 
+logger = getLogger(__name__)
+
 POINTS_GEOJSON = DATAFILES_PATH / 'points.json'
 LOCATIONS_GEOJSON = DATAFILES_PATH / 'locations.json'
+POINTS_GEOTILES = DATAFILES_PATH / 'tiles' / 'points'
+LOCATIONS_GEOTILES = DATAFILES_PATH / 'tiles' / 'locations'
+
+_placeholder_generators: WeakSet = WeakSet()
 
 
+@profiled('signal:setup_jinja_env')
 def setup_jinja_env(generator: ArticlesGenerator) -> Environment:
     generator.env.globals.update(GLOBALS)
     generator.env.filters.update(FILTERS)
@@ -54,31 +103,215 @@ def setup_jinja_env(generator: ArticlesGenerator) -> Environment:
     return generator.env
 
 
+@profiled('signal:prepare_picture_placeholders')
+def prepare_picture_placeholders(article_generator: ArticlesGenerator) -> None:
+    # Placeholders are computed in bulk before articles (and their pictures) are rendered;
+    # preread signal is sent for every article, sources are collected for the first one only
+    if not IMAGE_PLACEHOLDERS or article_generator in _placeholder_generators:
+        return
+    _placeholder_generators.add(article_generator)
+    sources = []
+    for path in Path(article_generator.path).rglob('*.md'):
+        sources.extend(find_picture_sources(path.read_text()))
+    prepare_image_placeholders(sources)
+
+
+def setup_markdown_reader(readers: Readers) -> None:
+    if PARALLEL_RENDERING:
+        use_prerendered_markdown_reader(readers.reader_classes)
+
+
+def setup_markdown_reader_profiling(readers: Readers) -> None:
+    # Connected after `setup_markdown_reader`, wrapping whichever reader it set up
+    profile_markdown_readers(readers.reader_classes)
+
+
+@profiled('signal:prerender_articles_in_workers')
+def prerender_articles_in_workers(article_generator: ArticlesGenerator) -> None:
+    # Connected after placeholders are prepared: forked workers inherit them
+    if PARALLEL_RENDERING:
+        prerender_articles(article_generator, max_workers=RENDERING_WORKERS or None)
+
+
+@profiled('signal:prepare_cover_placeholders')
+def prepare_cover_placeholders(article_generator: ArticlesGenerator) -> None:
+    if not IMAGE_PLACEHOLDERS:
+        return
+    covers = (article.metadata.get('cover') for article in article_generator.articles)
+    prepare_image_placeholders(covers)
+
+
+@profiled('signal:update_article_context')
 def update_article_context(article_generator: ArticlesGenerator, content: Article) -> None:
-    ctx = get_picture_context()
-    if not ctx:
+    pictures: PictureRegistry | None = content.metadata.get(PICTURE_REGISTRY_METADATA_KEY)
+    if not pictures:
         return
-    key, *_ = ctx.keys()
-    pictures = ctx.pop(key)
-    json_ld = Picture.create_json_ld(pictures)
-    content.json_ld = list(json_ld)
+    content.json_ld = pictures.create_json_ld()
+    lcp_picture = pictures.lcp_picture
+    content.preload_sources = lcp_picture.preload_sources if lcp_picture else ()
 
 
+@profiled('signal:write_points_geojson')
 def write_points_geojson(article_generator: ArticlesGenerator) -> None:
     geodata = get_geodata_from_articles(article_generator.articles)
-    geojson = json_dumps(geodata, ensure_ascii=False)
-    POINTS_GEOJSON.open('w').write(geojson)
+    write_geodata(POINTS_GEOJSON, geodata)
+    tiles = write_geotiles(POINTS_GEOTILES, geodata)
+    logger.info('Map points: %d features in %d tiles', len(geodata['features']), tiles)
+
+
+@profiled('signal:set_nearby_articles')
+def set_nearby_articles(article_generator: ArticlesGenerator) -> None:
+    if not NEARBY_ARTICLES:
+        return
+    started = perf_counter()
+    points = set_articles_nearby(article_generator.articles, NEARBY_ARTICLES)
+    logger.info('Nearby index: %d points in %.3fs', points, perf_counter() - started)
 
 
+@profiled('signal:write_locations_geojson')
 def write_locations_geojson(*args) -> None:
     geodata = get_geodata_from_dataset()
-    geojson = json_dumps(geodata, ensure_ascii=False)
-    LOCATIONS_GEOJSON.open('w').write(geojson)
+    write_geodata(LOCATIONS_GEOJSON, geodata)
+    tiles = write_geotiles(LOCATIONS_GEOTILES, geodata)
+    logger.info('Map locations: %d features in %d tiles', len(geodata['features']), tiles)
+
+
+@profiled('signal:collect_image_urls')
+def collect_image_urls(path: str, context: dict) -> None:
+    if not path.endswith('.html'):
+        return
+    page = Path(path).relative_to(context['OUTPUT_PATH']).as_posix()
+    image_url_manifest.collect(page, Path(path).read_text())
+
+
+@profiled('signal:write_image_urls_manifest')
+def write_image_urls_manifest(*args) -> None:
+    count = image_url_manifest.write()
+    image_url_manifest.clear()
+    logger.info('Image URL manifest: %d unique URLs', count)
+
+
+@profiled('signal:render_local_image_variants')
+def render_local_image_variants(*args) -> None:
+    if IMGRESIZE_BACKEND != 'local':
+        return
+    stats = render_image_variants(image_url_builder.variants).as_dict()
+    elapsed = stats['elapsed'] or 1e-9
+    logger.info(
+        'Image variants: %d from %d sources, %d rendered (%.1f/s, %.1f MiB/s), %d reused, '
+        '%d failed in %.2fs',
+        stats['variants'],
+        stats['sources'],
+        stats['rendered'],
+        stats['rendered'] / elapsed,
+        stats['rendered_bytes'] / elapsed / 1024 / 1024,
+        stats['reused'],
+        stats['failed'],
+        stats['elapsed'],
+    )
+
+
+def get_writer(*args) -> type[IncrementalWriter]:
+    return IncrementalWriter
+
+
+@profiled('signal:save_build_caches')
+def save_build_caches(*args) -> None:
+    image_dimensions_cache.save()
+    image_placeholder_cache.save()
+    picture_fragments_cache.save()
+    build_graph.save()
+
+
+def log_output_stats(*args) -> None:
+    stats = output_stats.as_dict()
+    output_stats.reset()
+    logger.info(
+        'Outputs: %d rebuilt, %d unchanged, %d skipped',
+        stats['rebuilt'],
+        stats['unchanged'],
+        stats['skipped'],
+    )
+    tiles = geotile_stats.as_dict()
+    geotile_stats.reset()
+    if tiles['rebuilt'] or tiles['unchanged']:
+        logger.info('Geodata tiles: %d rebuilt, %d unchanged', tiles['rebuilt'], tiles['unchanged'])
+
+
+def log_media_cache_info(*args) -> None:
+    for name, info in get_media_cache_info().items():
+        logger.info(
+            'Media cache %s: %d hits, %d misses, %d/%d entries',
+            name,
+            info['hits'],
+            info['misses'],
+            info['currsize'],
+            info['maxsize'],
+        )
+
+
+def log_picture_fragments_stats(*args) -> None:
+    if not picture_fragments_cache.enabled:
+        return
+    stats = picture_fragments_cache.as_dict()
+    logger.info(
+        'Picture fragments cache: %d hits, %d misses, %d entries',
+        stats['hits'],
+        stats['misses'],
+        stats['entries'],
+    )
+
+
+def log_width_plan_stats(*args) -> None:
+    if not IMGRESIZE_MAX_VARIANTS:
+        return
+    stats = width_plan_stats.as_dict()
+    logger.info(
+        'Resize width plan: %d images, %d -> %d variants, worst-case bytes overhead %.0f%%',
+        stats['images'],
+        stats['requested_variants'],
+        stats['planned_variants'],
+        stats['worst_overhead'] * 100,
+    )
+
+
+@profiled('signal:precompress_output')
+def precompress_output(*args) -> None:
+    if not PRECOMPRESS:
+        return
+    for line in precompress_output_files(OUTPUT_PATH).format():
+        logger.info('Precompressed %s', line)
+
+
+def write_profile_report(*args) -> None:
+    if not profiler.enabled:
+        return
+    count = profiler.write()
+    logger.info('Profile report: %d stages', count)
+    for line in profiler.format(PROFILE_TOP):
+        logger.info('Profile %s', line)
 
 
 def register() -> None:
     signals.article_generator_preread.connect(setup_jinja_env)
+    signals.get_writer.connect(get_writer)
+    signals.readers_init.connect(setup_markdown_reader)
+    signals.readers_init.connect(setup_markdown_reader_profiling)
+    signals.article_generator_preread.connect(prepare_picture_placeholders)
+    signals.article_generator_preread.connect(prerender_articles_in_workers)
     signals.page_generator_preread.connect(setup_jinja_env)
     signals.article_generator_write_article.connect(update_article_context)
     signals.article_generator_finalized.connect(write_points_geojson)
+    signals.article_generator_finalized.connect(set_nearby_articles)
+    signals.article_generator_finalized.connect(prepare_cover_placeholders)
+    signals.content_written.connect(collect_image_urls)
     signals.finalized.connect(write_locations_geojson)
+    signals.finalized.connect(render_local_image_variants)
+    signals.finalized.connect(write_image_urls_manifest)
+    signals.finalized.connect(save_build_caches)
+    signals.finalized.connect(log_media_cache_info)
+    signals.finalized.connect(log_picture_fragments_stats)
+    signals.finalized.connect(log_width_plan_stats)
+    signals.finalized.connect(precompress_output)
+    signals.finalized.connect(log_output_stats)
+    signals.finalized.connect(write_profile_report)
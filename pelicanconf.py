@@ -1,10 +1,11 @@
-from os import environ as env
+from os import environ
 from pathlib import Path
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 BASE_PATH = Path('.')
-load_dotenv()
+# `.env` values under process environment, without changing it: importing config has no side effects
+env = {**dotenv_values(), **environ}
 
 # Site setup
 AUTHOR = env.get('AUTHOR')
@@ -35,17 +36,19 @@ DATAFILES_PATH = OUTPUT_PATH / 'data'
 DATA_URL = '/data/'
 LOAD_CONTENT_CACHE = env.get('LOAD_CONTENT_CACHE') == 'true'
 DELETE_OUTPUT_DIRECTORY = env.get('DELETE_OUTPUT_DIRECTORY') == 'true'
-
-# Create build directories
-OUTPUT_PATH.mkdir(exist_ok=True)
-DATAFILES_PATH.mkdir(exist_ok=True)
+INCREMENTAL_BUILD = env.get('INCREMENTAL_BUILD') == 'true'  # skip rendering of up-to-date outputs
 
 # Staticfiles
 STATIC_PATHS = []
 STATIC_ASSETS_PATH = BASE_PATH / THEME
 STATIC_BUILD_PATH = OUTPUT_PATH / THEME_STATIC_DIR
 STATIC_URL = f'/{THEME_STATIC_DIR}/'
+PARALLEL_RENDERING = env.get('PARALLEL_RENDERING') == 'true'  # articles Markdown in processes
+RENDERING_WORKERS = int(env.get('RENDERING_WORKERS', '0'))  # 0 for CPU count
 INLINE_SCRIPTS = env.get('INLINE_SCRIPTS') == 'true'
+INLINE_MINIFY = env.get('INLINE_MINIFY') == 'true'  # with terser from node_modules
+PRECOMPRESS = env.get('PRECOMPRESS') == 'true'  # gzip/brotli siblings for text output
+PROFILE_BUILD = env.get('PROFILE_BUILD') == 'true'  # per-stage timings, see `invoke profile`
 
 # Processors/renderers setup
 MARKDOWN = {
@@ -66,14 +69,28 @@ IMGPROXY_URL_NAMESPACE = env.get('IMGPROXY_URL_NAMESPACE') or SITE_FQDN
 IMGPROXY_PLAIN_SOURCE_URL = env.get('IMGPROXY_PLAIN_SOURCE_URL') == 'true'
 
 # Media processing setup v2
+IMGRESIZE_BACKEND = env.get('IMGRESIZE_BACKEND') or 'cloudflare'  # cloudflare | imgproxy | local
 IMGSTORE_SERVICE_FQDN = env.get('IMGSTORE_SERVICE_FQDN') or 'r2.arsgab.io'
 IMGSTORE_SERVICE_BASE_PATH = env.get('IMGSTORE_SERVICE_BASE_PATH') or '/photos/'
 IMGRESIZE_SERVICE_FQDN = SITE_FQDN
 IMGRESIZE_SERVICE_BASE_PATH = '/cdn-cgi/image/'
+IMGRESIZE_CACHE_SIZE = int(env.get('IMGRESIZE_CACHE_SIZE', '32768'))
+IMGRESIZE_MAX_VARIANTS = int(env.get('IMGRESIZE_MAX_VARIANTS', '0'))  # 0 disables planner
+
+# Local copies of source images (optional), used for build-time processing
+IMAGES_SOURCE_PATH = Path(env['IMAGES_SOURCE_PATH']) if env.get('IMAGES_SOURCE_PATH') else None
+IMAGE_PLACEHOLDERS = env.get('IMAGE_PLACEHOLDERS') == 'true'
+BUILD_CACHE_PATH = BASE_PATH / '.cache'
+# Built pictures cached across builds, e.g. 16384; cache hits are left out of media stats
+PICTURE_FRAGMENTS_CACHE_SIZE = int(env.get('PICTURE_FRAGMENTS_CACHE_SIZE', '0'))  # 0 disables
+IMAGE_VARIANTS_PATH = OUTPUT_PATH / 'images'  # `local` resize backend output
+IMAGE_VARIANTS_URL = '/images/'
 
 
 # MapBox setup
 MAPBOX_API_TOKEN = env.get('MAPBOX_API_TOKEN', '')
+NEARBY_ARTICLES = int(env.get('NEARBY_ARTICLES', '4'))  # `article.nearby` size, 0 disables
+GEODATA_COMPACT = env.get('GEODATA_COMPACT') == 'true'  # columnar, see `utils/geoencoding.py`
 
 # Disable category/author/feeds pages build
 CATEGORY_SAVE_AS = AUTHOR_SAVE_AS = ''
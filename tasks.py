@@ -2,33 +2,37 @@ import os
 import shlex
 import shutil
 import sys
+from functools import cache
+from pathlib import Path
 
 from invoke import task
 from invoke.main import program
-from pelican import main as pelican_main
-from pelican.server import ComplexHTTPRequestHandler, RootedHTTPServer
-from pelican.settings import DEFAULT_CONFIG, get_settings_from_file
 
-from utils.staticfiles import generate_staticfiles_manifest
+from pelicanconf import OUTPUT_PATH
 
+# Pelican and task implementations (and their defaults) are imported by tasks using them,
+# keeping startup fast
 OPEN_BROWSER_ON_SERVE = True
 SETTINGS_FILE_BASE = 'pelicanconf.py'
-SETTINGS = {}
-SETTINGS.update(DEFAULT_CONFIG)
-LOCAL_SETTINGS = get_settings_from_file(SETTINGS_FILE_BASE)
-SETTINGS.update(LOCAL_SETTINGS)
 
 CONFIG = {
     'settings_base': SETTINGS_FILE_BASE,
     'settings_publish': 'publishconf.py',
     # Output path. Can be absolute or relative to tasks.py. Default: 'output'
-    'deploy_path': SETTINGS['OUTPUT_PATH'],
+    'deploy_path': OUTPUT_PATH,
     # Host and port for `serve`
     'host': 'localhost',
     'port': 8000,
 }
 
 
+@cache
+def get_settings() -> dict:
+    from pelican.settings import DEFAULT_CONFIG, get_settings_from_file
+
+    return {**DEFAULT_CONFIG, **get_settings_from_file(SETTINGS_FILE_BASE)}
+
+
 @task
 def clean(c):
     """Remove generated files"""
@@ -58,6 +62,7 @@ def regenerate(c):
 @task
 def serve(c):
     """Serve site at http://$HOST:$PORT/ (default is localhost:8000)"""
+    from pelican.server import ComplexHTTPRequestHandler, RootedHTTPServer
 
     class AddressReuseTCPServer(RootedHTTPServer):
         allow_reuse_address = True
@@ -76,6 +81,34 @@ def serve(c):
     server.serve_forever()
 
 
+@task
+def profile(c, top=None, report=None, cprofile=None):
+    """`build` with per-stage timings, `--cprofile` also dumps stats for snakeviz/flameprof"""
+    from utils.profiling import PROFILE_REPORT, PROFILE_TOP, profiler
+
+    top = PROFILE_TOP if top is None else int(top)
+    report = report or str(PROFILE_REPORT)
+    profiler.enable()
+    profiler.reset()
+    cprofiler = None
+    if cprofile:
+        from cProfile import Profile
+
+        cprofiler = Profile()
+        cprofiler.enable()
+    try:
+        pelican_run('-s {settings_base}'.format(**CONFIG))
+    finally:
+        if cprofiler:
+            cprofiler.disable()
+            cprofiler.dump_stats(cprofile)
+    profiler.write(Path(report))
+    sys.stderr.write('\n'.join(profiler.format(top)) + '\n')
+    sys.stderr.write(f'Report: {report}\n')
+    if cprofile:
+        sys.stderr.write(f'cProfile stats: {cprofile}\n')
+
+
 @task
 def reserve(c):
     """`build`, then `serve`"""
@@ -100,7 +133,8 @@ def livereload(c):
 
     cached_build()
     server = Server()
-    theme_path = SETTINGS['THEME']
+    settings = get_settings()
+    theme_path = settings['THEME']
     watched_globs = [
         CONFIG['settings_base'],
         f'{theme_path}/templates/**/*.html',
@@ -108,7 +142,7 @@ def livereload(c):
 
     content_file_extensions = ['.md', '.rst']
     for extension in content_file_extensions:
-        content_glob = '{}/**/*{}'.format(SETTINGS['PATH'], extension)
+        content_glob = '{}/**/*{}'.format(settings['PATH'], extension)
         watched_globs.append(content_glob)
 
     static_file_extensions = ['.css', '.js']
@@ -129,10 +163,45 @@ def livereload(c):
 
 
 def pelican_run(cmd):
+    from pelican import main as pelican_main
+
     cmd += ' ' + program.core.remainder  # allows to pass-through args to pelican
     pelican_main(shlex.split(cmd))
 
 
 @task
-def staticfiles(cmd):
-    generate_staticfiles_manifest()
+def staticfiles(cmd, force=False):
+    """Hash built CSS/JS files, `--force` rehashes unchanged ones too"""
+    from utils.staticfiles import generate_staticfiles_manifest
+
+    generate_staticfiles_manifest(incremental=not force)
+
+
+@task
+def warmup(
+    c,
+    manifest=None,
+    concurrency=None,
+    retries=None,
+    timeout=None,
+    origin=None,
+):
+    """Request every image URL of the last build to warm up resizer and CDN caches"""
+    from utils.imagemanifest import IMAGE_URLS_MANIFEST, load_image_urls
+    from utils.warmup import DEFAULT_CONCURRENCY, DEFAULT_RETRIES, DEFAULT_TIMEOUT, run_warmup
+
+    urls = load_image_urls(Path(manifest or IMAGE_URLS_MANIFEST))
+    report = run_warmup(
+        urls,
+        concurrency=DEFAULT_CONCURRENCY if concurrency is None else int(concurrency),
+        retries=DEFAULT_RETRIES if retries is None else int(retries),
+        timeout=DEFAULT_TIMEOUT if timeout is None else float(timeout),
+        origin=origin,
+    )
+    sys.stderr.write(f'{report.format()}\n')
+    for url, error in report.errors[:20]:
+        sys.stderr.write(f'  {error}: {url}\n')
+    if len(report.errors) > 20:
+        sys.stderr.write(f'  ... and {len(report.errors) - 20} more\n')
+    if report.failed:
+        sys.exit(1)
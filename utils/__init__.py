@@ -1,4 +1,31 @@
-# flake8: noqa
-from .datastructures import StrEnum
-from .media import ImageDimensions, ImageResize, ImageResizeSet, get_processed_image_url
-from .templating import render_template, render_template_partial
+from importlib import import_module
+
+# Public helpers by submodule, imported on first access (PEP 562): submodules pull in Pelican
+# and Jinja, which tasks and scripts importing a single light submodule do not need
+_EXPORTS = {
+    'StrEnum': 'datastructures',
+    'ImageDimensions': 'media',
+    'ImageResize': 'media',
+    'ImageResizeSet': 'media',
+    'get_image_resize_set': 'media',
+    'get_processed_image_url': 'media',
+    'get_source_image_dimensions': 'imageprobe',
+    'get_image_placeholder': 'placeholders',
+    'render_template': 'templating',
+    'render_template_partial': 'templating',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *_EXPORTS})
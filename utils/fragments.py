@@ -0,0 +1,136 @@
+from collections.abc import Iterable
+from hashlib import blake2b
+from json import dumps as json_dumps
+from json import loads as json_loads
+from pathlib import Path
+from threading import Lock
+from typing import Any
+from xml.etree.ElementTree import Element, SubElement
+
+import pelicanconf
+from pelicanconf import BUILD_CACHE_PATH, PICTURE_FRAGMENTS_CACHE_SIZE
+
+PICTURE_FRAGMENTS_CACHE = BUILD_CACHE_PATH / 'fragments.json'
+MEDIA_SETTINGS_PREFIXES = ('IMGRESIZE_', 'IMGSTORE_', 'IMGPROXY_', 'IMAGE_')
+FRAGMENT_DIGEST_SIZE = 16
+
+ElementData = list  # [tag, attrib, text, tail, [children]]
+
+
+def element_to_data(element: Element) -> ElementData:
+    children = [element_to_data(child) for child in element]
+    return [element.tag, dict(element.attrib), element.text, element.tail, children]
+
+
+def element_from_data(data: ElementData, parent: Element | None = None) -> Element:
+    tag, attrib, text, tail, children = data
+    element = Element(tag, attrib) if parent is None else SubElement(parent, tag, attrib)
+    element.text, element.tail = text, tail
+    for child in children:
+        element_from_data(child, element)
+    return element
+
+
+def get_fragments_version(paths: Iterable[Path]) -> str:
+    # Media settings plus sources fragments are built from: code and templates
+    digest = blake2b(digest_size=FRAGMENT_DIGEST_SIZE)
+    settings = {
+        name: str(value)
+        for name, value in vars(pelicanconf).items()
+        if name.startswith(MEDIA_SETTINGS_PREFIXES)
+    }
+    digest.update(json_dumps(settings, sort_keys=True).encode())
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class FragmentCache:
+    """Rendered fragments by key across builds, least recently used evicted beyond `max_size`."""
+
+    path: Path
+    max_size: int
+    hits: int = 0
+    misses: int = 0
+    _entries: dict[str, list] | None = None
+    _changed: bool = False
+    _journal: list[tuple[str, bool]]  # keys used (hit) or set, for merging from workers
+
+    def __init__(self, path: Path, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self._journal = []
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def entries(self) -> dict[str, list]:
+        if self._entries is None:
+            try:
+                self._entries = json_loads(self.path.read_text())
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    @staticmethod
+    def get_key(*parts: Any) -> str:
+        data = json_dumps(parts, sort_keys=True, separators=(',', ':'))
+        return blake2b(data.encode(), digest_size=FRAGMENT_DIGEST_SIZE).hexdigest()
+
+    def get(self, key: str) -> list | None:
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries[key] = entry  # most recently used last
+            self.hits += 1
+            self._changed = True
+            self._journal.append((key, True))
+            return entry
+
+    def set(self, key: str, entry: list) -> None:
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            self._changed = True
+            self._journal.append((key, False))
+
+    @property
+    def journal_size(self) -> int:
+        return len(self._journal)
+
+    def export(self, start: int = 0) -> list[tuple[str, list, bool]]:
+        return [(key, self.entries[key], hit) for key, hit in self._journal[start:]]
+
+    def merge(self, changes: Iterable[tuple[str, list, bool]]) -> None:
+        # Entries used and set by a worker process, see `export`
+        for key, entry, hit in changes:
+            self.set(key, entry)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            entries = self.entries
+            if len(entries) > self.max_size:
+                entries = dict(list(entries.items())[-self.max_size :])
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_suffix('.tmp')
+            temp_path.write_text(json_dumps(entries, ensure_ascii=False, separators=(',', ':')))
+            temp_path.replace(self.path)
+            self._entries = entries
+            self._changed = False
+
+    def as_dict(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+picture_fragments_cache = FragmentCache(PICTURE_FRAGMENTS_CACHE, PICTURE_FRAGMENTS_CACHE_SIZE)
@@ -0,0 +1,85 @@
+from collections.abc import Iterator
+from json import dumps as json_dumps
+from pathlib import Path
+
+from pelicanconf import GEODATA_COMPACT
+
+from .outputs import OutputStats, output_stats, write_if_changed
+
+GEODATA_COMPACT_VERSION = 1
+GEODATA_COMPACT_PRECISION = 5  # decimal degrees, ~1m
+MISSING_VALUE = -1
+
+
+def encode_geodata(geodata: dict, precision: int = GEODATA_COMPACT_PRECISION) -> dict:
+    """Columnar FeatureCollection: delta-encoded quantized coords, properties as value indices."""
+    features = geodata['features']
+    scale = 10**precision
+    coords = []
+    last_lng = last_lat = 0
+    for feature in features:
+        lng, lat = feature['geometry']['coordinates'][:2]
+        lng, lat = round(lng * scale), round(lat * scale)
+        coords.extend((lng - last_lng, lat - last_lat))
+        last_lng, last_lat = lng, lat
+
+    # Shared table for all property values, e.g. colors and years repeated across points
+    values = {}
+    keys = {key: None for feature in features for key in feature['properties']}
+    columns = {}
+    for key in keys:
+        column = columns[key] = []
+        for feature in features:
+            if key not in feature['properties']:
+                column.append(MISSING_VALUE)
+                continue
+            value = feature['properties'][key]
+            token = (type(value).__name__, value)
+            column.append(values.setdefault(token, len(values)))
+
+    return {
+        'v': GEODATA_COMPACT_VERSION,
+        'precision': precision,
+        'count': len(features),
+        'values': [value for _, value in values],
+        'coords': coords,
+        'properties': columns,
+    }
+
+
+def iter_decoded_features(data: dict) -> Iterator[dict]:
+    # Mirrors `decodeGeodata` from `mapbox.js`
+    scale = 10 ** data['precision']
+    values, coords, columns = data['values'], data['coords'], data['properties']
+    lng = lat = 0
+    for index in range(data['count']):
+        lng += coords[index * 2]
+        lat += coords[index * 2 + 1]
+        properties = {
+            key: values[column[index]]
+            for key, column in columns.items()
+            if column[index] != MISSING_VALUE
+        }
+        yield {
+            'type': 'Feature',
+            'properties': properties,
+            'geometry': {'type': 'Point', 'coordinates': [lng / scale, lat / scale]},
+        }
+
+
+def decode_geodata(data: dict) -> dict:
+    return {'type': 'FeatureCollection', 'features': list(iter_decoded_features(data))}
+
+
+def dump_geodata(geodata: dict, compact: bool = GEODATA_COMPACT) -> str:
+    data = encode_geodata(geodata) if compact else geodata
+    return json_dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_geodata(
+    path: Path,
+    geodata: dict,
+    compact: bool = GEODATA_COMPACT,
+    stats: OutputStats = output_stats,
+) -> bool:
+    return write_if_changed(path, dump_geodata(geodata, compact=compact).encode(), stats)
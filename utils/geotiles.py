@@ -0,0 +1,174 @@
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from json import dumps as json_dumps
+from math import atan, exp, floor, inf, log, pi, sin
+from pathlib import Path
+
+from .geoencoding import write_geodata
+from .outputs import OutputStats, write_if_changed
+
+GEOTILES_MIN_ZOOM = 0
+GEOTILES_MAX_ZOOM = 12  # tiles one zoom above hold unclustered points
+GEOTILES_RADIUS = 40  # cluster radius in pixels
+GEOTILES_EXTENT = 512  # tile size in pixels, same as Mapbox GL
+GEOTILES_ZOOM_OFFSET = 2  # tiles of zoom N are cut on zoom N-2 grid, ~1 file per viewport
+GEOTILES_INDEX_FILENAME = 'index.json'
+COORDS_PRECISION = 6
+MERCATOR_MAX_LAT = 85.051129
+CLUSTER_PROPERTIES = frozenset(('cluster', 'pointCount', 'expansionZoom'))
+PRECOMPRESSED_SUFFIXES = ('.gz', '.br')  # siblings written by `precompress_output`
+
+geotile_stats = OutputStats()  # hundreds of files per build, counted apart from pages
+
+
+def project(lng: float, lat: float) -> tuple[float, float]:
+    # Web Mercator to [0, 1] world coordinates
+    sin_lat = sin(min(max(lat, -MERCATOR_MAX_LAT), MERCATOR_MAX_LAT) * pi / 180)
+    y = 0.5 - 0.25 * log((1 + sin_lat) / (1 - sin_lat)) / pi
+    return lng / 360 + 0.5, y
+
+
+def unproject(x: float, y: float) -> tuple[float, float]:
+    lat = 360 * atan(exp((180 - y * 360) * pi / 180)) / pi - 90
+    return round((x - 0.5) * 360, COORDS_PRECISION), round(lat, COORDS_PRECISION)
+
+
+class ClusterNode:
+    """Point or cluster of points at a zoom level, in projected coordinates."""
+
+    __slots__ = ('x', 'y', 'count', 'properties', 'zoom')
+
+    x: float
+    y: float
+    count: int
+    properties: dict
+    zoom: float  # last zoom the node was processed at
+
+    def __init__(self, x: float, y: float, count: int, properties: dict):
+        self.x = x
+        self.y = y
+        self.count = count
+        self.properties = properties
+        self.zoom = inf
+
+    @classmethod
+    def from_feature(cls, feature: dict) -> 'ClusterNode':
+        x, y = project(*feature['geometry']['coordinates'][:2])
+        return cls(x, y, 1, feature['properties'])
+
+    @classmethod
+    def merge(cls, nodes: list['ClusterNode'], zoom: int) -> 'ClusterNode':
+        count = sum(node.count for node in nodes)
+        x = sum(node.x * node.count for node in nodes) / count
+        y = sum(node.y * node.count for node in nodes) / count
+        # Keep properties shared by all clustered points, e.g. trip color of its several coords
+        first, *rest = (node.properties for node in nodes)
+        shared = {
+            key: value
+            for key, value in first.items()
+            if key not in CLUSTER_PROPERTIES and all(props.get(key) == value for props in rest)
+        }
+        properties = {**shared, 'cluster': True, 'pointCount': count, 'expansionZoom': zoom + 1}
+        return cls(x, y, count, properties)
+
+    def as_feature(self) -> dict:
+        return {
+            'type': 'Feature',
+            'properties': self.properties,
+            'geometry': {'type': 'Point', 'coordinates': unproject(self.x, self.y)},
+        }
+
+    def get_tile(self, zoom: int) -> tuple[int, int]:
+        tiles = 2**zoom
+        return min(floor(self.x * tiles), tiles - 1), min(floor(self.y * tiles), tiles - 1)
+
+
+def cluster_zoom_level(
+    nodes: list[ClusterNode], zoom: int, radius: int = GEOTILES_RADIUS
+) -> list[ClusterNode]:
+    # Greedy clustering of previous (higher) zoom level nodes with a grid hash index
+    distance = radius / (GEOTILES_EXTENT * 2**zoom)
+    grid = defaultdict(list)
+    for node in nodes:
+        grid[int(node.x / distance), int(node.y / distance)].append(node)
+
+    clustered = []
+    for node in nodes:
+        if node.zoom <= zoom:
+            continue
+        node.zoom = zoom
+        cell_x, cell_y = int(node.x / distance), int(node.y / distance)
+        neighbors = [
+            neighbor
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for neighbor in grid.get((cell_x + dx, cell_y + dy), ())
+            if neighbor.zoom > zoom
+            and (neighbor.x - node.x) ** 2 + (neighbor.y - node.y) ** 2 <= distance**2
+        ]
+        if not neighbors:
+            clustered.append(node)
+            continue
+        for neighbor in neighbors:
+            neighbor.zoom = zoom
+        clustered.append(ClusterNode.merge([node, *neighbors], zoom))
+    return clustered
+
+
+def cluster_features(
+    features: Iterable[dict],
+    min_zoom: int = GEOTILES_MIN_ZOOM,
+    max_zoom: int = GEOTILES_MAX_ZOOM,
+    radius: int = GEOTILES_RADIUS,
+) -> Iterator[tuple[int, list[ClusterNode]]]:
+    nodes = [ClusterNode.from_feature(feature) for feature in features]
+    yield max_zoom + 1, nodes
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        nodes = cluster_zoom_level(nodes, zoom, radius=radius)
+        yield zoom, nodes
+
+
+def write_geotiles(
+    path: Path,
+    geodata: dict,
+    min_zoom: int = GEOTILES_MIN_ZOOM,
+    max_zoom: int = GEOTILES_MAX_ZOOM,
+    radius: int = GEOTILES_RADIUS,
+    zoom_offset: int = GEOTILES_ZOOM_OFFSET,
+) -> int:
+    """Write `{zoom}/{x}/{y}.json` FeatureCollection tiles of clustered points, plus an index.
+
+    Unchanged tiles are not rewritten, tiles that are gone are removed after the new index is.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    tile_paths = set()
+    for zoom, nodes in cluster_features(geodata['features'], min_zoom, max_zoom, radius):
+        tiles = defaultdict(list)
+        for node in nodes:
+            tiles[node.get_tile(max(zoom - zoom_offset, 0))].append(node.as_feature())
+        for (x, y), features in sorted(tiles.items()):
+            tile_path = path / str(zoom) / str(x) / f'{y}.json'
+            tile_path.parent.mkdir(parents=True, exist_ok=True)
+            tile = {'type': 'FeatureCollection', 'features': features}
+            write_geodata(tile_path, tile, stats=geotile_stats)
+            tile_paths.add(tile_path)
+
+    index = {
+        'minZoom': min_zoom,
+        'maxZoom': max_zoom + 1,
+        'zoomOffset': zoom_offset,
+        'tiles': sorted(tile.relative_to(path).with_suffix('').as_posix() for tile in tile_paths),
+    }
+    index_path = path / GEOTILES_INDEX_FILENAME
+    write_if_changed(index_path, json_dumps(index, separators=(',', ':')).encode(), geotile_stats)
+
+    # Compressed siblings of tiles still written are kept, they are updated with their tile
+    for stale_path in list(path.rglob('*.json')):
+        if stale_path not in tile_paths and stale_path != index_path:
+            stale_path.unlink()
+            for suffix in PRECOMPRESSED_SUFFIXES:
+                stale_path.with_name(stale_path.name + suffix).unlink(missing_ok=True)
+    for tile_dir in sorted(path.rglob('*'), reverse=True):
+        if tile_dir.is_dir() and not any(tile_dir.iterdir()):
+            tile_dir.rmdir()
+    return len(tile_paths)
@@ -0,0 +1,62 @@
+from collections.abc import Iterator
+from json import dumps as json_dumps
+from json import loads as json_loads
+from pathlib import Path
+from re import Pattern
+from re import compile as re_compile
+from re import escape as re_escape
+from threading import Lock
+
+from pelicanconf import DATAFILES_PATH
+
+from .media import image_url_builder
+from .outputs import write_if_changed
+
+IMAGE_URLS_MANIFEST = DATAFILES_PATH / 'images.json'
+# Processed image URLs contain commas (`width=320,q=80`), but srcset separates them with ", "
+IMAGE_URL_PATTERN: Pattern = re_compile(
+    re_escape(image_url_builder.prefix) + r"""(?:[^\s"'<>),]|,(?=[^\s"'<>),]))+"""
+)
+
+
+class ImageURLManifest:
+    # {page: {url, ...}}, filled from written output files
+    pages: dict[str, set[str]]
+
+    def __init__(self):
+        self.pages = {}
+        self._lock = Lock()
+
+    def collect(self, page: str, text: str) -> int:
+        urls = set(IMAGE_URL_PATTERN.findall(text))
+        if urls:
+            with self._lock:
+                self.pages.setdefault(page, set()).update(urls)
+        return len(urls)
+
+    def as_dict(self) -> dict:
+        pages = {page: sorted(urls) for page, urls in sorted(self.pages.items())}
+        unique = set().union(*self.pages.values()) if self.pages else set()
+        return {'count': len(unique), 'pages': pages}
+
+    def write(self, path: Path = IMAGE_URLS_MANIFEST) -> int:
+        data = self.as_dict()
+        write_if_changed(path, json_dumps(data, ensure_ascii=False).encode())
+        return data['count']
+
+    def clear(self) -> None:
+        with self._lock:
+            self.pages.clear()
+
+
+image_url_manifest = ImageURLManifest()
+
+
+def load_image_urls(path: Path = IMAGE_URLS_MANIFEST) -> list[str]:
+    data = json_loads(path.read_text())
+    return list(dict.fromkeys(_iter_manifest_urls(data)))
+
+
+def _iter_manifest_urls(data: dict) -> Iterator[str]:
+    for urls in data.get('pages', {}).values():
+        yield from urls
@@ -0,0 +1,208 @@
+from collections.abc import Iterator
+from json import dumps as json_dumps
+from json import loads as json_loads
+from pathlib import Path
+from struct import error as StructError
+from struct import unpack, unpack_from
+from threading import Lock
+from typing import BinaryIO
+
+from pelicanconf import BUILD_CACHE_PATH, IMAGES_SOURCE_PATH
+
+from .media import ImageDimensions, get_source_image_filename
+
+IMAGE_DIMENSIONS_CACHE = BUILD_CACHE_PATH / 'dimensions.json'
+PROBE_HEADER_SIZE = 32
+PROBE_BOX_BUFFER_SIZE = 64 * 1024
+JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD))
+JPEG_STANDALONE_MARKERS = frozenset((0x01, *range(0xD0, 0xD9)))
+JPEG_APP1_MARKER = 0xE1
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSED_ORIENTATIONS = frozenset((5, 6, 7, 8))
+ISOBMFF_BRANDS = frozenset((b'avif', b'avis', b'heic', b'heix', b'mif1', b'msf1'))
+ISOBMFF_CONTAINER_BOXES = {b'meta': 4, b'iprp': 0, b'ipco': 0}  # box type: header bytes to skip
+
+Box = tuple[bytes, int, int]  # type, payload start, end
+
+
+def probe_image_dimensions(path: Path) -> ImageDimensions | None:
+    try:
+        with path.open('rb') as file:
+            header = file.read(PROBE_HEADER_SIZE)
+            if header[:2] == b'\xff\xd8':
+                return _probe_jpeg(file)
+            if header[4:8] == b'ftyp' and header[8:12] in ISOBMFF_BRANDS:
+                file.seek(0)
+                return _probe_isobmff(file.read(PROBE_BOX_BUFFER_SIZE))
+            return _probe_png(header) or _probe_webp(header) or _probe_gif(header)
+    except (OSError, StructError):
+        return None
+
+
+def _probe_jpeg(file: BinaryIO) -> ImageDimensions | None:
+    file.seek(2)
+    transposed = False
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:  # fill byte
+            file.seek(-1, 1)
+            continue
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        (length,) = unpack('>H', file.read(2))
+        if code in JPEG_SOF_MARKERS:
+            _, height, width = unpack('>BHH', file.read(5))
+            return ImageDimensions(height, width) if transposed else ImageDimensions(width, height)
+        if code == JPEG_APP1_MARKER:
+            segment = file.read(length - 2)
+            transposed = transposed or _read_exif_orientation(segment) in (
+                EXIF_TRANSPOSED_ORIENTATIONS
+            )
+            continue
+        file.seek(length - 2, 1)
+
+
+def _read_exif_orientation(segment: bytes) -> int:
+    if not segment.startswith(b'Exif\x00\x00'):
+        return 1
+    tiff = memoryview(segment)[6:]
+    byte_order = {b'II': '<', b'MM': '>'}.get(bytes(tiff[:2]))
+    if not byte_order:
+        return 1
+    (ifd_offset,) = unpack_from(f'{byte_order}I', tiff, 4)
+    (entries_count,) = unpack_from(f'{byte_order}H', tiff, ifd_offset)
+    for index in range(entries_count):
+        entry_offset = ifd_offset + 2 + index * 12
+        tag, _, _, value = unpack_from(f'{byte_order}HHIH', tiff, entry_offset)
+        if tag == EXIF_ORIENTATION_TAG:
+            return value
+    return 1
+
+
+def _probe_png(header: bytes) -> ImageDimensions | None:
+    if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+    return ImageDimensions(*unpack('>II', header[16:24]))
+
+
+def _probe_gif(header: bytes) -> ImageDimensions | None:
+    if header[:4] != b'GIF8':
+        return None
+    return ImageDimensions(*unpack('<HH', header[6:10]))
+
+
+def _probe_webp(header: bytes) -> ImageDimensions | None:
+    if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        return None
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        width, height = unpack('<HH', header[26:30])
+        return ImageDimensions(width & 0x3FFF, height & 0x3FFF)
+    if chunk == b'VP8L':
+        (bits,) = unpack('<I', header[21:25])
+        return ImageDimensions((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b'VP8X':
+        width = int.from_bytes(header[24:27], 'little') + 1
+        height = int.from_bytes(header[27:30], 'little') + 1
+        return ImageDimensions(width, height)
+    return None
+
+
+def _probe_isobmff(data: bytes) -> ImageDimensions | None:
+    # Largest `ispe` property is the primary image (others are thumbnails/grid tiles)
+    dimensions = None
+    transposed = False
+    for box_type, start, _ in _iter_isobmff_boxes(data, 0, len(data)):
+        if box_type == b'ispe':
+            width, height = unpack_from('>II', data, start + 4)
+            if not dimensions or width * height > dimensions.width * dimensions.height:
+                dimensions = ImageDimensions(width, height)
+        elif box_type == b'irot':
+            transposed = bool(data[start] & 1)
+    if dimensions and transposed:
+        return ImageDimensions(dimensions.height, dimensions.width)
+    return dimensions
+
+
+def _iter_isobmff_boxes(data: bytes, start: int, end: int) -> Iterator[Box]:
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            (size,) = unpack_from('>Q', data, offset + 8)
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        box_end = min(offset + size, end)
+        payload_start = offset + header_size
+        yield box_type, payload_start, box_end
+        if box_type in ISOBMFF_CONTAINER_BOXES:
+            skip = ISOBMFF_CONTAINER_BOXES[box_type]
+            yield from _iter_isobmff_boxes(data, payload_start + skip, box_end)
+        offset += size
+
+
+class ImageDimensionsCache:
+    # Entries: {path: [mtime_ns, size, width, height]}, zero width for unknown formats
+    path: Path
+    _entries: dict[str, list[int]] | None = None
+    _changed: bool = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = Lock()
+
+    @property
+    def entries(self) -> dict[str, list[int]]:
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self) -> dict[str, list[int]]:
+        try:
+            return json_loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, image_path: Path) -> ImageDimensions | None:
+        try:
+            stat = image_path.stat()
+        except OSError:
+            return None
+        key = str(image_path)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        with self._lock:
+            entry = self.entries.get(key)
+        if not entry or entry[:2] != signature:
+            dimensions = probe_image_dimensions(image_path) or ImageDimensions()
+            entry = [*signature, *dimensions]
+            with self._lock:
+                self.entries[key] = entry
+                self._changed = True
+        width, height = entry[2:]
+        return ImageDimensions(width, height) if width and height else None
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_suffix('.tmp')
+            temp_path.write_text(json_dumps(self.entries, sort_keys=True))
+            temp_path.replace(self.path)
+            self._changed = False
+
+
+image_dimensions_cache = ImageDimensionsCache(IMAGE_DIMENSIONS_CACHE)
+
+
+def get_source_image_dimensions(source_url: str) -> ImageDimensions | None:
+    if IMAGES_SOURCE_PATH is None or source_url.startswith('http'):
+        return None
+    return image_dimensions_cache.get(IMAGES_SOURCE_PATH / get_source_image_filename(source_url))
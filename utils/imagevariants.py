@@ -0,0 +1,355 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hashlib import blake2b
+from json import dumps as json_dumps
+from json import loads as json_loads
+from logging import getLogger
+from math import ceil
+from os import cpu_count, getpid, link
+from pathlib import Path
+from shutil import copyfile
+from time import perf_counter
+from typing import Any
+
+from pelicanconf import BUILD_CACHE_PATH, IMAGE_VARIANTS_PATH, IMAGES_SOURCE_PATH
+
+from .media import ImageVariant
+
+logger = getLogger(__name__)
+
+IMAGE_VARIANTS_CACHE_PATH = BUILD_CACHE_PATH / 'variants'
+IMAGE_VARIANTS_INDEX = BUILD_CACHE_PATH / 'variants.json'
+VARIANT_RENDERER_VERSION = 1  # Bump to re-encode all cached variants
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_DIGEST_SIZE = 16
+DEFAULT_QUALITY = 80
+SAVE_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'avif': 'AVIF'}
+FILL_MODES = frozenset(('fill', 'cover', 'crop'))
+# imgproxy and Cloudflare gravity names, as `ImageOps.fit` centering
+GRAVITY_CENTERING: dict[str, tuple[float, float]] = {
+    'no': (0.5, 0.0),
+    'so': (0.5, 1.0),
+    'ea': (1.0, 0.5),
+    'we': (0.0, 0.5),
+    'noea': (1.0, 0.0),
+    'nowe': (0.0, 0.0),
+    'soea': (1.0, 1.0),
+    'sowe': (0.0, 1.0),
+    'top': (0.5, 0.0),
+    'bottom': (0.5, 1.0),
+    'left': (0.0, 0.5),
+    'right': (1.0, 0.5),
+}
+DEFAULT_CENTERING = (0.5, 0.5)
+# Options besides output size that make variants differ
+VARIANT_IDENTITY: tuple[tuple[str, ...], ...] = (
+    ('crop', 'c'),
+    ('rt', 'fit'),
+    ('gravity', 'g'),
+    ('blur', 'bl'),
+    ('q', 'quality'),
+)
+
+VariantJob = tuple[Path, dict[str, Any], str]  # cache file, options, ext
+
+
+def _get_option(options: dict[str, Any], *names: str, default: Any = None) -> Any:
+    for name in names:
+        if options.get(name) is not None:
+            return options[name]
+    return default
+
+
+def _get_centering(gravity: Any) -> tuple[float, float]:
+    return GRAVITY_CENTERING.get(str(gravity or ''), DEFAULT_CENTERING)
+
+
+def _get_decode_scale(options: dict[str, Any], width: int, height: int) -> float:
+    # Smallest scale the source can be decoded at and still yield this variant
+    if _get_option(options, 'crop', 'c'):
+        return 1.0
+    target_width = int(_get_option(options, 'width', 'w', default=0))
+    target_height = int(_get_option(options, 'height', 'h', default=0))
+    fill = _get_option(options, 'rt', 'fit') in FILL_MODES
+    scales = [
+        target_width / width if target_width else 0,
+        target_height / height if target_height else 0,
+    ]
+    if not any(scales):
+        return 1.0
+    if target_width and target_height and not fill:
+        return min(scales)
+    return max(scales)
+
+
+def _crop(image: Any, crop: str) -> Any:
+    # imgproxy syntax: {width}:{height}:{gravity}, values up to 1 are fractions of source size
+    width, height, gravity, *_ = [*crop.split(':'), '', '', ''][:3]
+    width, height = float(width or 0), float(height or 0)
+    width = int(image.width * width) if 0 < width <= 1 else int(width or image.width)
+    height = int(image.height * height) if 0 < height <= 1 else int(height or image.height)
+    width, height = min(width, image.width), min(height, image.height)
+    center_x, center_y = _get_centering(gravity)
+    left = round((image.width - width) * center_x)
+    top = round((image.height - height) * center_y)
+    return image.crop((left, top, left + width, top + height))
+
+
+def _process_variant(image: Any, options: dict[str, Any]) -> Any:
+    from PIL import Image, ImageFilter, ImageOps
+
+    crop = _get_option(options, 'crop', 'c')
+    if crop:
+        image = _crop(image, str(crop))
+
+    width = int(_get_option(options, 'width', 'w', default=0))
+    height = int(_get_option(options, 'height', 'h', default=0))
+    if width and height and _get_option(options, 'rt', 'fit') in FILL_MODES:
+        centering = _get_centering(_get_option(options, 'gravity', 'g'))
+        image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS, centering=centering)
+    elif width or height:
+        # Scale down only, keeping aspect ratio
+        scale = min(
+            width / image.width if width else 1.0,
+            height / image.height if height else 1.0,
+            1.0,
+        )
+        if scale < 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    blur = float(_get_option(options, 'blur', 'bl', default=0))
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur))
+    return image
+
+
+def _save_variant(image: Any, path: Path, ext: str, options: dict[str, Any], icc: Any) -> int:
+    save_format = SAVE_FORMATS[ext]
+    quality = int(_get_option(options, 'q', 'quality', default=DEFAULT_QUALITY))
+    if save_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    params = {
+        'JPEG': {'quality': quality, 'optimize': True, 'progressive': True},
+        'WEBP': {'quality': quality, 'method': 4},
+        'AVIF': {'quality': quality},
+        'PNG': {'optimize': True},
+    }[save_format]
+    if icc:
+        params['icc_profile'] = icc
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'{path.name}.{getpid()}.tmp')
+    image.save(temp_path, format=save_format, **params)
+    temp_path.replace(path)
+    return path.stat().st_size
+
+
+def render_source_variants(source_path: Path, jobs: list[VariantJob]) -> list[tuple[Path, int]]:
+    # Decodes source once for all its variants, runs in worker processes; size -1 is failure
+    from PIL import Image, ImageOps
+
+    results = []
+    with Image.open(source_path) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # rotated by 90°
+            width, height = height, width
+        scale = max(_get_decode_scale(options, width, height) for _, options, _ in jobs)
+        if scale < 1.0:
+            # JPEG decoder can scale down by 1/2..1/8 while decoding
+            image.draft(image.mode, (ceil(image.width * scale), ceil(image.height * scale)))
+        icc = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        # Widths past source size are scaled down only, so such variants often are the same
+        encoded: dict[tuple, Path] = {}
+        for path, options, ext in jobs:
+            try:
+                variant = _process_variant(image, options)
+                key = (variant.size, ext, *(_get_option(options, *o) for o in VARIANT_IDENTITY))
+                if key in encoded:
+                    _link_file(encoded[key], path)
+                    size = path.stat().st_size
+                else:
+                    size = _save_variant(variant, path, ext, options, icc)
+                    encoded[key] = path
+            except Exception as exc:
+                logger.warning('Unable to render %s variant %s: %s', source_path, options, exc)
+                size = -1
+            results.append((path, size))
+    return results
+
+
+def _hash_file(path: Path) -> str:
+    digest = blake2b(digest_size=HASH_DIGEST_SIZE)
+    with path.open('rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_file(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if target.exists() and target.samefile(source):
+            return
+        target.unlink(missing_ok=True)
+        link(source, target)
+    except OSError:
+        copyfile(source, target)
+
+
+class ImageVariantsStats:
+    variants: int = 0
+    sources: int = 0
+    rendered: int = 0
+    reused: int = 0
+    failed: int = 0
+    rendered_bytes: int = 0
+    elapsed: float = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            'variants': self.variants,
+            'sources': self.sources,
+            'rendered': self.rendered,
+            'reused': self.reused,
+            'failed': self.failed,
+            'rendered_bytes': self.rendered_bytes,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+class ImageVariantRenderer:
+    # Content-addressed: variants are cached by source digest × options, in `cache_path`;
+    # source digests by path, size and mtime, in `index_path`
+    cache_path: Path
+    index_path: Path
+    source_path: Path | None
+    output_path: Path
+    files: dict[str, list]
+    _loaded: bool = False
+
+    def __init__(
+        self,
+        cache_path: Path = IMAGE_VARIANTS_CACHE_PATH,
+        index_path: Path = IMAGE_VARIANTS_INDEX,
+        source_path: Path | None = IMAGES_SOURCE_PATH,
+        output_path: Path = IMAGE_VARIANTS_PATH,
+    ):
+        self.cache_path = cache_path
+        self.index_path = index_path
+        self.source_path = source_path
+        self.output_path = output_path
+        self.files = {}
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            self.files = json_loads(self.index_path.read_text()).get('files') or {}
+        except (OSError, ValueError):
+            return
+
+    def save(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.index_path.with_suffix('.tmp')
+        temp_path.write_text(json_dumps({'files': self.files}, sort_keys=True))
+        temp_path.replace(self.index_path)
+
+    def get_cache_file(self, digest: str, variant: ImageVariant) -> Path:
+        options = json_dumps(variant.options, separators=(',', ':'), default=str)
+        key_data = f'{VARIANT_RENDERER_VERSION}\0{digest}\0{options}\0{variant.ext}'
+        key = blake2b(key_data.encode(), digest_size=HASH_DIGEST_SIZE).hexdigest()
+        return self.cache_path / key[:2] / f'{key}.{variant.ext}'
+
+    def render(
+        self, variants: dict[str, ImageVariant], max_workers: int | None = None
+    ) -> ImageVariantsStats:
+        stats = ImageVariantsStats()
+        stats.variants = len(variants)
+        if not variants:
+            return stats
+        if self.source_path is None:
+            logger.error('IMAGES_SOURCE_PATH is required to render image variants locally')
+            stats.failed = len(variants)
+            return stats
+
+        started = perf_counter()
+        self.load()
+        with ProcessPoolExecutor(max_workers=max_workers or cpu_count()) as executor:
+            digests = self._get_source_digests({v.source for v in variants.values()}, executor)
+            stats.sources = len(digests)
+
+            cache_files: dict[str, Path] = {}
+            jobs: dict[str, list[VariantJob]] = {}
+            for path, variant in variants.items():
+                digest = digests.get(variant.source)
+                if digest is None:
+                    continue
+                cache_file = cache_files[path] = self.get_cache_file(digest, variant)
+                if cache_file.is_file():
+                    stats.reused += 1
+                else:
+                    job = (cache_file, dict(variant.options), variant.ext)
+                    jobs.setdefault(variant.source, []).append(job)
+
+            futures = [
+                executor.submit(render_source_variants, self.source_path / source, source_jobs)
+                for source, source_jobs in jobs.items()
+            ]
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as exc:
+                    logger.warning('Unable to render image variants: %s', exc)
+                    continue
+                for _, size in results:
+                    if size >= 0:
+                        stats.rendered += 1
+                        stats.rendered_bytes += size
+
+        for path, cache_file in cache_files.items():
+            if cache_file.is_file():
+                _link_file(cache_file, self.output_path / path)
+        stats.failed = stats.variants - stats.rendered - stats.reused
+        self.save()
+        stats.elapsed = perf_counter() - started
+        return stats
+
+    def _get_source_digests(
+        self, sources: Iterable[str], executor: ProcessPoolExecutor
+    ) -> dict[str, str]:
+        digests, missing = {}, []
+        for source in sources:
+            path = self.source_path / source
+            try:
+                stat = path.stat()
+            except OSError:
+                logger.warning('Source image %s not found', path)
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            entry = self.files.get(source)
+            if entry and entry[:2] == signature:
+                digests[source] = entry[2]
+            else:
+                missing.append((source, path, signature))
+
+        paths = [path for _, path, _ in missing]
+        for (source, _, signature), digest in zip(
+            missing, executor.map(_hash_file, paths, chunksize=8), strict=True
+        ):
+            digests[source] = digest
+            self.files[source] = [*signature, digest]
+        return digests
+
+
+image_variant_renderer = ImageVariantRenderer()
+
+
+def render_image_variants(
+    variants: dict[str, ImageVariant], max_workers: int | None = None
+) -> ImageVariantsStats:
+    return image_variant_renderer.render(variants, max_workers=max_workers)
@@ -1,25 +1,40 @@
 from base64 import urlsafe_b64encode
-from collections.abc import Iterable, Iterator
+from collections.abc import Callable, Iterable, Iterator
+from functools import lru_cache
 from hashlib import sha256
 from hmac import new as hmac_new
 from os.path import splitext
 from re import VERBOSE
 from re import compile as re_compile
+from sys import intern
 from textwrap import wrap
 from typing import Any, NamedTuple, Optional
 
 from pelicanconf import (
+    IMAGE_VARIANTS_URL,
     IMGPROXY_DEFAULT_QUALITY,
+    IMGPROXY_FQDN,
     IMGPROXY_KEY,
+    IMGPROXY_PLAIN_SOURCE_URL,
     IMGPROXY_SALT,
+    IMGPROXY_URL_SOURCE_FQDN,
+    IMGRESIZE_BACKEND,
+    IMGRESIZE_CACHE_SIZE,
+    IMGRESIZE_MAX_VARIANTS,
     IMGRESIZE_SERVICE_BASE_PATH,
     IMGRESIZE_SERVICE_FQDN,
     IMGSTORE_SERVICE_BASE_PATH,
     IMGSTORE_SERVICE_FQDN,
+    SITE_FQDN,
 )
 
+from .profiling import profiled
+from .variants import plan_widths, width_plan_stats
+
 _KEY = bytes.fromhex(IMGPROXY_KEY or '')
 _SALT = bytes.fromhex(IMGPROXY_SALT or '')
+# Keyed and salted once, every signature continues from a copy of this state
+_SIGNATURE_HMAC = hmac_new(_KEY, _SALT, digestmod=sha256)
 
 DEFAULT_IMAGE_EXTENSION = '.jpeg'
 MAX_IMAGE_WIDTH = 1400
@@ -34,24 +49,242 @@ SIZED_IMAGE_FILENAME_PATTERN = re_compile(
 )
 
 
+# Processing options are always serialized in this order, unknown ones go after known
+IMAGE_PROCESSING_OPTIONS_ORDER: tuple[str, ...] = (
+    'width',
+    'w',
+    'height',
+    'h',
+    'fit',
+    'crop',
+    'cachebuster',
+    'gravity',
+    'rt',
+    'blur',
+    'q',
+)
+VARIANT_SLUG_UNSAFE_PATTERN = re_compile(r'[^A-Za-z0-9.]+')
+# imgproxy names of processing options, unknown ones are passed as is
+IMGPROXY_OPTION_NAMES: dict[str, str] = {
+    'width': 'w',
+    'height': 'h',
+    'fit': 'rt',
+    'crop': 'c',
+    'cachebuster': 'cb',
+    'gravity': 'g',
+    'blur': 'bl',
+}
+# imgproxy values of Cloudflare-style option values, by imgproxy option name
+IMGPROXY_GRAVITY_VALUES: dict[str, str] = {
+    'top': 'no',
+    'bottom': 'so',
+    'left': 'we',
+    'right': 'ea',
+    'auto': 'sm',
+}
+IMGPROXY_OPTION_VALUES: dict[str, dict[str, str]] = {
+    'rt': {'cover': 'fill', 'contain': 'fit'},
+    'g': IMGPROXY_GRAVITY_VALUES,
+}
+
+
+class ImageURLBuilder:
+    __slots__ = ('prefix', 'source_prefix', '_ranks', '_unknown_rank', '_ordered_keys', '_sources')
+
+    def __init__(
+        self,
+        service_fqdn: str = IMGRESIZE_SERVICE_FQDN,
+        service_base_path: str = IMGRESIZE_SERVICE_BASE_PATH,
+        store_fqdn: str = IMGSTORE_SERVICE_FQDN,
+        store_base_path: str = IMGSTORE_SERVICE_BASE_PATH,
+        options_order: Iterable[str] = IMAGE_PROCESSING_OPTIONS_ORDER,
+    ):
+        self.prefix = intern(f'https://{service_fqdn}{service_base_path}')
+        self.source_prefix = intern(f'https://{store_fqdn}{store_base_path}')
+        self._ranks = {option: rank for rank, option in enumerate(options_order)}
+        self._unknown_rank = len(self._ranks)
+        self._ordered_keys: dict[tuple[str, ...], tuple[str, ...]] = {}
+        self._sources: dict[str, str] = {}
+
+    def build(self, source_url_or_path: str, ext: str = 'auto', **options: Any) -> str:
+        if not source_url_or_path:
+            return ''
+        source_url = self.qualify_source_url(source_url_or_path)
+        return f'{self.prefix}{self.format_options(options, ext)}/{source_url}'
+
+    def prepare(
+        self, source_url_or_path: str, ext: str = 'auto', **options: Any
+    ) -> Callable[[int], str]:
+        # Everything but `width` is formatted once, for generating many variants of a source
+        if not source_url_or_path:
+            return lambda width: ''
+        options.pop('width', None)
+        head = f'{self.prefix}width='
+        tail = f',{self.format_options(options, ext)}/{self.qualify_source_url(source_url_or_path)}'
+        return lambda width: f'{head}{width}{tail}'
+
+    def build_widths(
+        self, source_url_or_path: str, widths: Iterable[int], ext: str = 'auto', **options: Any
+    ) -> list[str]:
+        return list(map(self.prepare(source_url_or_path, ext=ext, **options), widths))
+
+    def format_options(self, options: dict[str, Any], ext: str = 'auto') -> str:
+        ordered_keys = self.order_options(tuple(options))
+        parts = [f'{key}={options[key]}' for key in ordered_keys if options[key] is not None]
+        if ext is not None:
+            parts.append(f'format={ext}')
+        parts.append('metadata=none')
+        return ','.join(parts)
+
+    def order_options(self, keys: tuple[str, ...]) -> tuple[str, ...]:
+        ordered_keys = self._ordered_keys.get(keys)
+        if ordered_keys is None:
+            ranks, unknown_rank = self._ranks, self._unknown_rank
+            ordered_keys = tuple(sorted(keys, key=lambda key: ranks.get(key, unknown_rank)))
+            self._ordered_keys[keys] = ordered_keys
+        return ordered_keys
+
+    def qualify_source_url(self, source_url: str) -> str:
+        qualified = self._sources.get(source_url)
+        if qualified is None:
+            qualified = get_source_image_filename(source_url)
+            if not qualified.startswith('http'):
+                qualified = f'{self.source_prefix}{qualified}'
+            self._sources[source_url] = qualified
+        return qualified
+
+
+class ImgproxyURLBuilder(ImageURLBuilder):
+    # Signed URLs: https://{fqdn}/{signature}/{options}/{encoded source}.{ext}
+    __slots__ = ('plain_sources', '_encoded_sources')
+
+    def __init__(
+        self,
+        service_fqdn: str = IMGPROXY_FQDN,
+        store_fqdn: str = IMGPROXY_URL_SOURCE_FQDN or IMGSTORE_SERVICE_FQDN,
+        store_base_path: str = IMGSTORE_SERVICE_BASE_PATH,
+        plain_sources: bool = IMGPROXY_PLAIN_SOURCE_URL,
+        options_order: Iterable[str] = IMAGE_PROCESSING_OPTIONS_ORDER,
+    ):
+        super().__init__(service_fqdn, '', store_fqdn, store_base_path, options_order)
+        self.plain_sources = plain_sources
+        self._encoded_sources: dict[tuple[str, str], str] = {}
+
+    def build(self, source_url_or_path: str, ext: str = 'auto', **options: Any) -> str:
+        if not source_url_or_path:
+            return ''
+        source = self.encode_source_url(source_url_or_path, ext)
+        return self.sign_path('/' + '/'.join(filter(None, (self.format_options(options), source))))
+
+    def prepare(
+        self, source_url_or_path: str, ext: str = 'auto', **options: Any
+    ) -> Callable[[int], str]:
+        if not source_url_or_path:
+            return lambda width: ''
+        options.pop('width', None)
+        source = self.encode_source_url(source_url_or_path, ext)
+        tail = '/'.join(filter(None, (self.format_options(options), source)))
+        return lambda width: self.sign_path(f'/w:{width}/{tail}')
+
+    def format_options(self, options: dict[str, Any], ext: str = 'auto') -> str:
+        # Output format goes with the source, as its extension
+        return '/'.join(
+            _format_imgproxy_option(key, options[key])
+            for key in self.order_options(tuple(options))
+            if options[key] is not None
+        )
+
+    def encode_source_url(self, source_url_or_path: str, ext: str = 'auto') -> str:
+        encoded = self._encoded_sources.get((source_url_or_path, ext))
+        if encoded is None:
+            source_url = self.qualify_source_url(source_url_or_path)
+            ext = '' if ext in (None, 'auto') else ext
+            if self.plain_sources:
+                encoded = f'plain/{source_url}' + (f'@{ext}' if ext else '')
+            else:
+                encoded = _encode_source_image_url(source_url) + (f'.{ext}' if ext else '')
+            self._encoded_sources[source_url_or_path, ext] = encoded
+        return encoded
+
+    def sign_path(self, path: str) -> str:
+        return f'{self.prefix}/{_generate_image_path_signature(path)}{path}'
+
+
+class ImageVariant(NamedTuple):
+    source: str  # source image filename, e.g. alsace/IMG_7804.2326x4134.jpeg
+    options: tuple[tuple[str, Any], ...]
+    ext: str
+
+
+class LocalImageURLBuilder(ImageURLBuilder):
+    # Variants are rendered from local originals at the end of build, see `utils.imagevariants`:
+    # https://{SITE_FQDN}{IMAGE_VARIANTS_URL}{source base}/{options slug}.{ext}, absolute as
+    # other backends' URLs: Open Graph and JSON-LD consumers need them so
+    __slots__ = ('variants',)
+
+    def __init__(
+        self,
+        service_fqdn: str = SITE_FQDN,
+        base_path: str = IMAGE_VARIANTS_URL,
+        options_order: Iterable[str] = IMAGE_PROCESSING_OPTIONS_ORDER,
+    ):
+        super().__init__(options_order=options_order)
+        self.prefix = intern(f'https://{service_fqdn}{base_path}')
+        self.variants: dict[str, ImageVariant] = {}
+
+    def build(self, source_url_or_path: str, ext: str = 'auto', **options: Any) -> str:
+        if not source_url_or_path:
+            return ''
+        source = get_source_image_filename(source_url_or_path)
+        if source.startswith('http'):
+            return source  # Not a local original, served as is
+        base, source_ext = splitext(source)
+        ext = {None: source_ext.lstrip('.'), 'auto': 'webp'}.get(ext, ext)
+        ordered_options = tuple(
+            (key, options[key])
+            for key in self.order_options(tuple(options))
+            if options[key] is not None
+        )
+        path = f'{base}/{self.format_options(dict(ordered_options), ext)}.{ext}'
+        if path not in self.variants:
+            self.variants[path] = ImageVariant(source, ordered_options, ext)
+        return f'{self.prefix}{path}'
+
+    def prepare(
+        self, source_url_or_path: str, ext: str = 'auto', **options: Any
+    ) -> Callable[[int], str]:
+        options.pop('width', None)
+        return lambda width: self.build(source_url_or_path, ext, width=width, **options)
+
+    def format_options(self, options: dict[str, Any], ext: str = 'auto') -> str:
+        names, unsafe = IMGPROXY_OPTION_NAMES, VARIANT_SLUG_UNSAFE_PATTERN
+        slug = '-'.join(f'{names.get(k, k)}{unsafe.sub("_", str(v))}' for k, v in options.items())
+        return slug or 'original'
+
+
+@profiled('url:get_processed_image_url')
+@lru_cache(maxsize=IMGRESIZE_CACHE_SIZE)
 def get_processed_image_url(
     source_url_or_path: str,
     encode_source_url: bool = False,
     ext: str = 'auto',
     **options: Any,
 ) -> str:
-    if not source_url_or_path:
-        return ''
-    source_url = _qualify_source_image_url(source_url_or_path)
-    options |= {'format': ext, 'metadata': 'none'}
-    processing_options = ','.join(f'{k}={v}' for k, v in options.items() if v is not None)
-    return f'https://{IMGRESIZE_SERVICE_FQDN}{IMGRESIZE_SERVICE_BASE_PATH}{processing_options}/{source_url}'
+    return image_url_builder.build(source_url_or_path, ext=ext, **options)
 
 
 def get_resized_image_url(source_url: str, width: int, ext: str = 'webp', **extra: Any) -> str:
     return get_processed_image_url(source_url, width=width, ext=ext, **extra)
 
 
+IMAGE_URL_BUILDERS: dict[str, type[ImageURLBuilder]] = {
+    'cloudflare': ImageURLBuilder,
+    'imgproxy': ImgproxyURLBuilder,
+    'local': LocalImageURLBuilder,
+}
+image_url_builder = IMAGE_URL_BUILDERS[IMGRESIZE_BACKEND]()
+
+
 class ImageDimensions(NamedTuple):
     width: int = 0
     height: int = 0
@@ -95,10 +328,14 @@ class ImageResize(NamedTuple):
         return self.media_query
 
 
+ResizeLayout = tuple[int, str, tuple[tuple[int, int], ...]]  # width, condition, (width, factor)
+
+
 class ImageResizeSet:
     source_url: str
     source_width: int
     max_width: int
+    max_variants: int
     sources: Iterable[ImageResize] = ()
     fallback: str | None = None
 
@@ -108,11 +345,13 @@ class ImageResizeSet:
         source_width: int | None = MAX_SOURCE_WIDTH,
         max_width: int | None = MAX_IMAGE_WIDTH,
         breakpoints: Iterable[int] | None = DEFAULT_BREAKPOINTS,
+        max_variants: int = IMGRESIZE_MAX_VARIANTS,
         **processing_options: Any,
     ):
         self.source_url = source_url
         self.source_width = source_width
         self.max_width = max_width
+        self.max_variants = max_variants
         self.sources = tuple(self.get_resizes(breakpoints=breakpoints, **processing_options))
         self.fallback = self.get_fallback(max_width=max_width, ext='jpg', **processing_options)
 
@@ -122,58 +361,85 @@ class ImageResizeSet:
         factors: Iterable[int] = (2,),
         **processing_options: Any,
     ) -> Iterator[ImageResize]:
-        factors = factors or ()
         quality = processing_options.pop('q', None) or IMGPROXY_DEFAULT_QUALITY
         params = {**processing_options, 'q': quality}
+        get_url = image_url_builder.prepare(self.source_url, ext='webp', **params)
+        layout = tuple(self._get_resizes_layout(breakpoints, factors or ()))
+
+        # Planner mode: snap widths to shared site-wide ladder, limiting variants per image
+        planned_widths = {}
+        if self.max_variants:
+            requested = [width for _, _, widths in layout for width, _ in widths]
+            plan = plan_widths(requested, self.source_width, self.max_variants)
+            width_plan_stats.record(len(set(requested)), plan)
+            planned_widths = plan.widths
 
+        last_resize = None
+        for width, condition, widths in layout:
+            urls = ((get_url(planned_widths.get(w, w)), factor) for w, factor in widths)
+            srcset = tuple(url if factor == 1 else f'{url} {factor}x' for url, factor in urls)
+            previous = last_resize if condition == 'max-width' else None
+            last_resize = ImageResize(width, srcset, condition=condition, previous=previous)
+            yield last_resize
+
+    def _get_resizes_layout(
+        self, breakpoints: Iterable[int] | None, factors: Iterable[int]
+    ) -> Iterator[ResizeLayout]:
         # Single resized image source requested, no intermediate resizes
         if breakpoints is None:
-            srcset = (
-                get_resized_image_url(self.source_url, width=self.max_width, **params),
-                *self._get_factors(self.max_width, factors, **params),
-            )
-            yield ImageResize(self.max_width, srcset, condition='any')
+            widths = ((self.max_width, 1), *self._get_factors(self.max_width, factors))
+            yield self.max_width, 'any', widths
             return
 
-        relevant_breakpoints = filter(lambda b: b < self.source_width, breakpoints)
-        last_resize = None
-        for bp in relevant_breakpoints:
-            srcset = (
-                get_resized_image_url(self.source_url, width=bp, **params),
-                *self._get_factors(bp, factors, **params),
-            )
-            last_resize = ImageResize(bp, srcset, previous=last_resize)
-            yield last_resize
+        last_width = None
+        for bp in breakpoints:
+            if bp >= self.source_width:
+                continue
+            yield bp, 'max-width', ((bp, 1), *self._get_factors(bp, factors))
+            last_width = bp
 
-        factored = self._get_factors(self.max_width, factors, **params)
-        srcset = (
-            get_resized_image_url(self.source_url, width=MAX_IMAGE_WIDTH, **params),
-            *factored,
-        )
-        yield ImageResize(
-            last_resize.width + 1 if last_resize else 1,
-            srcset,
-            condition='min-width',
-        )
+        widths = ((MAX_IMAGE_WIDTH, 1), *self._get_factors(self.max_width, factors))
+        yield last_width + 1 if last_width else 1, 'min-width', widths
 
-    def _get_factors(
-        self,
-        width: int,
-        factors: Iterable[int],
-        **extra: Any,
-    ) -> Iterator[str]:
+    def _get_factors(self, width: int, factors: Iterable[int]) -> Iterator[tuple[int, int]]:
         for factor in factors:
             factored_width = width * factor
             if self.source_width <= factored_width:
                 continue
-            src = get_resized_image_url(self.source_url, width=factored_width, **extra)
-            yield f'{src} {factor}x'
+            yield factored_width, factor
 
     def get_fallback(self, max_width: int | None = MAX_IMAGE_WIDTH, **kwargs: Any) -> str:
         return get_resized_image_url(self.source_url, width=max_width, **kwargs)
 
 
-def _qualify_source_image_url(source_url: str) -> str:
+@lru_cache(maxsize=IMGRESIZE_CACHE_SIZE)
+def get_image_resize_set(
+    source_url: str,
+    source_width: int | None = MAX_SOURCE_WIDTH,
+    max_width: int | None = MAX_IMAGE_WIDTH,
+    breakpoints: tuple[int, ...] | None = DEFAULT_BREAKPOINTS,
+    **processing_options: Any,
+) -> ImageResizeSet:
+    # Resize sets are shared between callers, treat them as read-only
+    return ImageResizeSet(
+        source_url,
+        source_width=source_width,
+        max_width=max_width,
+        breakpoints=breakpoints,
+        **processing_options,
+    )
+
+
+def get_media_cache_info() -> dict[str, dict[str, int]]:
+    caches = {
+        'resize_sets': get_image_resize_set,
+        'urls': get_processed_image_url.__wrapped__,  # cache under profiling wrapper
+        'signatures': _generate_image_path_signature,
+    }
+    return {name: cache.cache_info()._asdict() for name, cache in caches.items()}
+
+
+def get_source_image_filename(source_url: str) -> str:
     img_base, img_ext = splitext(source_url)
 
     # It's not an extension, it's dimensions part...
@@ -181,11 +447,7 @@ def _qualify_source_image_url(source_url: str) -> str:
         img_base = f'{img_base}{img_ext}'
         img_ext = None
 
-    source_url = img_base + (img_ext or DEFAULT_IMAGE_EXTENSION)
-    if source_url.startswith('http'):
-        return source_url
-
-    return f'https://{IMGSTORE_SERVICE_FQDN}{IMGSTORE_SERVICE_BASE_PATH}{source_url}'
+    return img_base + (img_ext or DEFAULT_IMAGE_EXTENSION)
 
 
 def _encode_source_image_url(source_url: str) -> str:
@@ -193,6 +455,22 @@ def _encode_source_image_url(source_url: str) -> str:
     return '/'.join(wrap(source_url.decode(), 16))
 
 
-def _generate_image_path_signature(path: str) -> bytes:
-    digest = hmac_new(_KEY, msg=_SALT + path.encode(), digestmod=sha256).digest()
-    return urlsafe_b64encode(digest).rstrip(b'=')
+def _format_imgproxy_option(key: str, value: Any) -> str:
+    name = IMGPROXY_OPTION_NAMES.get(key, key)
+    if name == 'c':
+        # {width}:{height}:{gravity}
+        parts = str(value).split(':')
+        if len(parts) > 2:
+            parts[2] = IMGPROXY_GRAVITY_VALUES.get(parts[2], parts[2])
+        return f'c:{":".join(parts)}'
+    values = IMGPROXY_OPTION_VALUES.get(name)
+    return f'{name}:{values.get(value, value) if values else value}'
+
+
+@lru_cache(maxsize=IMGRESIZE_CACHE_SIZE)
+def _generate_image_path_signature(path: str) -> str:
+    if not _KEY:
+        return 'insecure'
+    signature = _SIGNATURE_HMAC.copy()
+    signature.update(path.encode())
+    return urlsafe_b64encode(signature.digest()).rstrip(b'=').decode()
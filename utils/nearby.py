@@ -0,0 +1,131 @@
+from collections.abc import Hashable, Iterable
+from heapq import heappush, heapreplace
+from math import asin, cos, radians, sin
+from typing import NamedTuple
+
+from pelican.contents import Article
+
+from .datastructures import _extract_articles_coords, get_geodata_from_dataset
+
+EARTH_RADIUS_KM = 6371.0088
+DISTANCE_PRECISION = 1
+
+Vector = tuple[float, float, float]
+
+
+def to_unit_vector(lng: float, lat: float) -> Vector:
+    lng, lat = radians(lng), radians(lat)
+    return cos(lat) * cos(lng), cos(lat) * sin(lng), sin(lat)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    return round(2 * EARTH_RADIUS_KM * asin(min(squared_chord**0.5 / 2, 1.0)), DISTANCE_PRECISION)
+
+
+class SphereKDTree:
+    """Static KD-tree over points on the sphere as unit vectors, where chord distance is
+    monotonic with great-circle distance, so nearest neighbors are exact."""
+
+    __slots__ = ('vectors', 'keys')
+
+    vectors: list[Vector]
+    keys: list[Hashable]
+
+    def __init__(self, points: Iterable[tuple[Hashable, float, float]]):
+        items = [(key, to_unit_vector(lng, lat)) for key, lng, lat in points]
+        self._build(items, 0, len(items), 0)
+        self.keys = [key for key, _ in items]
+        self.vectors = [vector for _, vector in items]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def _build(cls, items: list, lo: int, hi: int, depth: int) -> None:
+        # Balanced tree in implicit layout: median of each slice is its node
+        if hi - lo <= 1:
+            return
+        axis = depth % 3
+        items[lo:hi] = sorted(items[lo:hi], key=lambda item: item[1][axis])
+        mid = (lo + hi) // 2
+        cls._build(items, lo, mid, depth + 1)
+        cls._build(items, mid + 1, hi, depth + 1)
+
+    def query(self, lng: float, lat: float, count: int) -> list[tuple[float, Hashable]]:
+        """`count` nearest points as `(distance in km, key)`, closest first."""
+        heap = []
+        if count > 0:
+            self._query(to_unit_vector(lng, lat), count, heap, 0, len(self.keys), 0)
+        return [
+            (chord_to_km(-distance), self.keys[index]) for distance, index in sorted(heap)[::-1]
+        ]
+
+    def _query(self, target: Vector, count: int, heap: list, lo: int, hi: int, depth: int) -> None:
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        vector = self.vectors[mid]
+        distance = sum((a - b) ** 2 for a, b in zip(target, vector, strict=True))
+        if len(heap) < count:
+            heappush(heap, (-distance, mid))
+        elif distance < -heap[0][0]:
+            heapreplace(heap, (-distance, mid))
+
+        axis = depth % 3
+        diff = target[axis] - vector[axis]
+        near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+        self._query(target, count, heap, *near, depth + 1)
+        if len(heap) < count or diff**2 < -heap[0][0]:
+            self._query(target, count, heap, *far, depth + 1)
+
+
+class NearbyPlace(NamedTuple):
+    title: str
+    distance: float  # km, between closest coords
+    url: str | None = None
+    article: Article | None = None
+
+
+def _nearest_distinct(
+    tree: SphereKDTree, coords: list[tuple[float, float]], limit: int, exclude: Hashable = None
+) -> list[tuple[float, Hashable]]:
+    # Keys may have several points (trip coords), so widen query until `limit` distinct keys
+    count = limit * 2 + len(coords)
+    while True:
+        nearest = {}
+        for lng, lat in coords:
+            for distance, key in tree.query(lng, lat, count):
+                if key != exclude and distance < nearest.get(key, float('inf')):
+                    nearest[key] = distance
+        if len(nearest) >= limit or count >= len(tree):
+            ordered = sorted(nearest.items(), key=lambda item: item[1])[:limit]
+            return [(distance, key) for key, distance in ordered]
+        count *= 2
+
+
+def set_articles_nearby(articles: Iterable[Article], limit: int) -> int:
+    """Set `nearby` (other articles) and `nearby_locations` (dataset entries) on articles."""
+    articles = list(articles)
+    articles_coords = {}
+    for article, coords in _extract_articles_coords(articles):
+        articles_coords.setdefault(article, []).append(coords[:2])
+    locations = get_geodata_from_dataset()['features']
+
+    articles_tree = SphereKDTree(
+        (article, lng, lat) for article, coords in articles_coords.items() for lng, lat in coords
+    )
+    locations_tree = SphereKDTree(
+        (index, *feature['geometry']['coordinates']) for index, feature in enumerate(locations)
+    )
+    for article in articles:
+        article.nearby = article.nearby_locations = ()
+    for article, coords in articles_coords.items():
+        article.nearby = tuple(
+            NearbyPlace(other.title, distance, url=other.url, article=other)
+            for distance, other in _nearest_distinct(articles_tree, coords, limit, article)
+        )
+        article.nearby_locations = tuple(
+            NearbyPlace(locations[location_index]['properties']['title'], distance)
+            for distance, location_index in _nearest_distinct(locations_tree, coords, limit)
+        )
+    return len(articles_tree) + len(locations_tree)
@@ -0,0 +1,44 @@
+from pathlib import Path
+from threading import Lock
+
+
+class OutputStats:
+    """Build outputs by outcome: rebuilt (written), unchanged (identical, not written) and
+    skipped (not rendered at all, dependencies unchanged)."""
+
+    rebuilt: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def as_dict(self) -> dict[str, int]:
+        return {'rebuilt': self.rebuilt, 'unchanged': self.unchanged, 'skipped': self.skipped}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.rebuilt = self.unchanged = self.skipped = 0
+
+
+output_stats = OutputStats()
+
+
+def write_if_changed(path: Path, content: bytes, stats: OutputStats = output_stats) -> bool:
+    # Identical outputs keep their mtime, so syncing/uploading output skips them
+    try:
+        if path.stat().st_size == len(content) and path.read_bytes() == content:
+            stats.record('unchanged')
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'{path.name}.tmp')
+    temp_path.write_bytes(content)
+    temp_path.replace(path)
+    stats.record('rebuilt')
+    return True
@@ -0,0 +1,144 @@
+from base64 import b64encode
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from io import BytesIO
+from json import dumps as json_dumps
+from json import loads as json_loads
+from logging import getLogger
+from os import cpu_count
+from pathlib import Path
+
+from pelicanconf import BUILD_CACHE_PATH, IMAGE_PLACEHOLDERS, IMAGES_SOURCE_PATH
+
+from .media import get_source_image_filename
+
+logger = getLogger(__name__)
+
+IMAGE_PLACEHOLDERS_CACHE = BUILD_CACHE_PATH / 'placeholders.json'
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+PLACEHOLDER_DECODE_SIZE = PLACEHOLDER_SIZE * 8
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_DIGEST_SIZE = 16
+
+
+def create_image_placeholder(path: Path) -> tuple[str, str]:
+    # Returns content digest and tiny WebP data URI, runs in worker processes
+    from PIL import Image, ImageOps
+
+    digest = blake2b(digest_size=HASH_DIGEST_SIZE)
+    with path.open('rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    with Image.open(path) as image:
+        # JPEG decoder can scale down while decoding, much cheaper than full decode
+        image.draft('RGB', (PLACEHOLDER_DECODE_SIZE, PLACEHOLDER_DECODE_SIZE))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buffer = BytesIO()
+        image.save(buffer, format='WEBP', quality=PLACEHOLDER_QUALITY, method=6)
+    encoded = b64encode(buffer.getvalue()).decode()
+    return digest.hexdigest(), f'data:image/webp;base64,{encoded}'
+
+
+def _create_image_placeholder_safe(path: Path) -> tuple[str, str] | None:
+    try:
+        return create_image_placeholder(path)
+    except Exception as exc:
+        logger.warning('Unable to create placeholder for %s: %s', path, exc)
+        return None
+
+
+class ImagePlaceholderCache:
+    # {"files": {path: [mtime_ns, size, digest]}, "placeholders": {digest: data_uri}}
+    path: Path
+    files: dict[str, list]
+    placeholders: dict[str, str]
+    _loaded: bool = False
+    _changed: bool = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.files = {}
+        self.placeholders = {}
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json_loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        self.files = data.get('files') or {}
+        self.placeholders = data.get('placeholders') or {}
+
+    def get(self, image_path: Path) -> str:
+        self.load()
+        entry = self.files.get(str(image_path))
+        if not entry:
+            return ''
+        return self.placeholders.get(entry[2], '')
+
+    def prepare(self, image_paths: Iterable[Path], max_workers: int | None = None) -> int:
+        self.load()
+        missing = []
+        for image_path in set(image_paths):
+            try:
+                stat = image_path.stat()
+            except OSError:
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            entry = self.files.get(str(image_path))
+            if not entry or entry[:2] != signature or entry[2] not in self.placeholders:
+                missing.append((image_path, signature))
+        if not missing:
+            return 0
+
+        paths = [image_path for image_path, _ in missing]
+        with ProcessPoolExecutor(max_workers=max_workers or cpu_count()) as executor:
+            results = executor.map(_create_image_placeholder_safe, paths, chunksize=8)
+            for (image_path, signature), result in zip(missing, results, strict=True):
+                if result is None:
+                    continue
+                digest, placeholder = result
+                self.files[str(image_path)] = [*signature, digest]
+                self.placeholders[digest] = placeholder
+        self._changed = True
+        return len(missing)
+
+    def save(self) -> None:
+        if not self._changed:
+            return
+        # Drop placeholders no file refers to anymore
+        digests = {entry[2] for entry in self.files.values()}
+        self.placeholders = {k: v for k, v in self.placeholders.items() if k in digests}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix('.tmp')
+        data = {'files': self.files, 'placeholders': self.placeholders}
+        temp_path.write_text(json_dumps(data, sort_keys=True))
+        temp_path.replace(self.path)
+        self._changed = False
+
+
+image_placeholder_cache = ImagePlaceholderCache(IMAGE_PLACEHOLDERS_CACHE)
+
+
+def _get_source_image_path(source_url: str) -> Path | None:
+    if not IMAGE_PLACEHOLDERS or IMAGES_SOURCE_PATH is None or source_url.startswith('http'):
+        return None
+    return IMAGES_SOURCE_PATH / get_source_image_filename(source_url)
+
+
+def prepare_image_placeholders(source_urls: Iterable[str]) -> int:
+    paths = filter(None, map(_get_source_image_path, filter(None, source_urls)))
+    return image_placeholder_cache.prepare(paths)
+
+
+def get_image_placeholder(source_url: str) -> str:
+    image_path = _get_source_image_path(source_url or '')
+    if image_path is None:
+        return ''
+    return image_placeholder_cache.get(image_path)
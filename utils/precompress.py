@@ -0,0 +1,124 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from gzip import compress as gzip_compress
+from hashlib import blake2b
+from importlib.util import find_spec
+from json import dumps as json_dumps
+from json import loads as json_loads
+from logging import getLogger
+from os import cpu_count
+from pathlib import Path
+
+from pelicanconf import BUILD_CACHE_PATH
+
+logger = getLogger(__name__)
+
+PRECOMPRESS_INDEX = BUILD_CACHE_PATH / 'precompress.json'
+PRECOMPRESS_SUFFIXES = frozenset(
+    ('.html', '.json', '.css', '.js', '.svg', '.xml', '.txt', '.webmanifest', '.ico')
+)
+PRECOMPRESS_MIN_SIZE = 256
+HASH_DIGEST_SIZE = 16
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# [digest, size, gzip size, brotli size], compressed size is 0 when sibling is not worth it
+PrecompressEntry = list
+
+
+def _write_sibling(path: Path, suffix: str, data: bytes | None, size: int) -> int:
+    sibling = path.with_name(f'{path.name}{suffix}')
+    if data is None or len(data) >= size:
+        sibling.unlink(missing_ok=True)
+        return 0
+    temp_path = sibling.with_name(f'{sibling.name}.tmp')
+    temp_path.write_bytes(data)
+    temp_path.replace(sibling)
+    return len(data)
+
+
+def _has_siblings(path: Path, entry: PrecompressEntry) -> bool:
+    return all(
+        not size or path.with_name(f'{path.name}{suffix}').is_file()
+        for suffix, size in (('.gz', entry[2]), ('.br', entry[3]))
+    )
+
+
+def precompress_file(path: Path, previous: PrecompressEntry | None) -> PrecompressEntry | None:
+    # Writes `.gz` and `.br` siblings unless content is the same as last time; runs in workers
+    data = path.read_bytes()
+    digest = blake2b(data, digest_size=HASH_DIGEST_SIZE).hexdigest()
+    if previous and previous[0] == digest and _has_siblings(path, previous):
+        return None
+
+    size = len(data)
+    gzip_data = gzip_compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    brotli_data = None
+    if find_spec('brotli'):
+        import brotli
+
+        mode = brotli.MODE_GENERIC if path.suffix == '.ico' else brotli.MODE_TEXT
+        brotli_data = brotli.compress(data, mode=mode, quality=BROTLI_QUALITY)
+    gzip_size = _write_sibling(path, '.gz', gzip_data, size)
+    brotli_size = _write_sibling(path, '.br', brotli_data, size)
+    return [digest, size, gzip_size, brotli_size]
+
+
+class PrecompressStats:
+    # {suffix: [files, compressed files, bytes, gzip bytes, brotli bytes]}
+    suffixes: dict[str, list[int]]
+
+    def __init__(self):
+        self.suffixes = {}
+
+    def record(self, suffix: str, entry: PrecompressEntry, compressed: bool) -> None:
+        _, size, gzip_size, brotli_size = entry
+        stats = self.suffixes.setdefault(suffix, [0, 0, 0, 0, 0])
+        stats[0] += 1
+        stats[1] += compressed
+        stats[2] += size
+        stats[3] += gzip_size or size
+        stats[4] += brotli_size or size
+
+    def format(self) -> Iterable[str]:
+        for suffix, (files, compressed, size, gzip_size, brotli_size) in sorted(
+            self.suffixes.items()
+        ):
+            yield (
+                f'{suffix}: {files} files ({compressed} compressed), {size / 1024:.0f} KiB, '
+                f'gzip {gzip_size / 1024:.0f} KiB (-{100 - gzip_size / size * 100:.0f}%), '
+                f'brotli {brotli_size / 1024:.0f} KiB (-{100 - brotli_size / size * 100:.0f}%)'
+            )
+
+
+def precompress_output(output_path: Path, max_workers: int | None = None) -> PrecompressStats:
+    if not find_spec('brotli'):
+        logger.warning('brotli is not installed, only gzip siblings are written')
+    try:
+        index = json_loads(PRECOMPRESS_INDEX.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    files = sorted(
+        path
+        for path in output_path.rglob('*')
+        if path.suffix in PRECOMPRESS_SUFFIXES
+        and path.is_file()
+        and path.stat().st_size >= PRECOMPRESS_MIN_SIZE
+    )
+    names = [path.relative_to(output_path).as_posix() for path in files]
+    previous = [index.get(name) for name in names]
+
+    stats = PrecompressStats()
+    updated = {}
+    with ProcessPoolExecutor(max_workers=max_workers or cpu_count()) as executor:
+        results = executor.map(precompress_file, files, previous, chunksize=16)
+        for path, name, entry, result in zip(files, names, previous, results, strict=True):
+            updated[name] = result or entry
+            stats.record(path.suffix, updated[name], compressed=result is not None)
+
+    PRECOMPRESS_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = PRECOMPRESS_INDEX.with_suffix('.tmp')
+    temp_path.write_text(json_dumps(updated, sort_keys=True))
+    temp_path.replace(PRECOMPRESS_INDEX)
+    return stats
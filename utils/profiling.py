@@ -0,0 +1,118 @@
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from json import dumps as json_dumps
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any
+
+from pelicanconf import BUILD_CACHE_PATH, PROFILE_BUILD
+
+PROFILE_REPORT = BUILD_CACHE_PATH / 'profile.json'
+PROFILE_TOP = 25
+
+
+class BuildProfiler:
+    """Inclusive wall time and call counts of build stages, by `category:name`.
+
+    Disabled by default (`PROFILE_BUILD`), instrumented calls then cost a flag check only.
+    Stages running in worker processes are measured as a whole, by the stage starting them.
+    """
+
+    enabled: bool
+    _timings: dict[str, list]  # name: [calls, total, max]
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._timings = {}
+        self._lock = Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timings = {}
+
+    def record(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - started)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, perf_counter() - started)
+
+            return wrapper
+
+        return decorator
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            timings = sorted(self._timings.items(), key=lambda item: -item[1][1])
+        return {
+            name: {'calls': calls, 'total': total, 'mean': total / calls, 'max': max_}
+            for name, (calls, total, max_) in timings
+        }
+
+    def format(self, top: int = PROFILE_TOP) -> list[str]:
+        timings = self.as_dict()
+        width = max((len(name) for name in list(timings)[:top]), default=0)
+        lines = [f'{"stage":<{width}}  {"calls":>7}  {"total s":>9}  {"mean ms":>9}  {"max ms":>9}']
+        for name, timing in list(timings.items())[:top]:
+            lines.append(
+                f'{name:<{width}}  {timing["calls"]:>7}  {timing["total"]:>9.3f}  '
+                f'{timing["mean"] * 1000:>9.3f}  {timing["max"] * 1000:>9.3f}'
+            )
+        if len(timings) > top:
+            lines.append(f'... and {len(timings) - top} more in the JSON report')
+        return lines
+
+    def write(self, path: Path = PROFILE_REPORT) -> int:
+        timings = self.as_dict()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json_dumps(timings, indent=2))
+        return len(timings)
+
+
+profiler = BuildProfiler(PROFILE_BUILD)
+profiled = profiler.timed
+
+
+def profile_markdown_readers(reader_classes: dict) -> None:
+    # Conversion time per article, readers are replaced only when profiling
+    from pelican.readers import MarkdownReader
+
+    if not profiler.enabled:
+        return
+    for fmt, reader_class in reader_classes.items():
+        if not issubclass(reader_class, MarkdownReader):
+            continue
+
+        def read(self, source_path: str, _read: Callable = reader_class.read) -> tuple[str, dict]:
+            with profiler.measure(f'markdown:{Path(source_path).name}'):
+                return _read(self, source_path)
+
+        reader_classes[fmt] = type(reader_class.__name__, (reader_class,), {'read': read})
@@ -1,40 +1,128 @@
 import hashlib
 from collections.abc import Iterable
-from functools import cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, partial
 from json import dumps as json_dumps
 from json import loads as json_loads
-from random import choice as rand_choice
-from string import ascii_lowercase
+from logging import getLogger
+from pathlib import Path
+from re import compile as re_compile
+from shutil import copyfile
+from subprocess import run
+from typing import NamedTuple
 
-from pelicanconf import STATIC_ASSETS_PATH, STATIC_BUILD_PATH, STATIC_URL
+from pelicanconf import (
+    BASE_PATH,
+    BUILD_CACHE_PATH,
+    INLINE_MINIFY,
+    STATIC_ASSETS_PATH,
+    STATIC_BUILD_PATH,
+    STATIC_URL,
+    THEME_STATIC_PATHS,
+)
+
+logger = getLogger(__name__)
 
 STATIC_MANIFEST = STATIC_BUILD_PATH / 'manifest.json'
+STATIC_MANIFEST_INDEX = BUILD_CACHE_PATH / 'staticfiles.json'
 ALLOWED_INLINE_SUFFIXES = {'.css', '.js', '.json'}
+HASHED_SUFFIXES = {'.css', '.js'}
+HASH_CHUNK_SIZE = 1024 * 1024
+STATIC_VERSION_DIGEST_SIZE = 4
+FICLONE = 0x40049409  # Linux ioctl, copy-on-write clone of whole file
+TERSER_BIN = BASE_PATH / 'node_modules' / '.bin' / 'terser'
+TERSER_OPTIONS = ('--compress', 'ecma=2016,drop_console=true', '--mangle', 'toplevel')
+
+
+class InlineAssets(NamedTuple):
+    paths: tuple[Path, ...]  # matched files and their directories
+    signature: tuple | None
+    content: str
+
+
+_inline_assets: dict[tuple[str, bool], InlineAssets] = {}
+
+
+class StaticFileVersion(NamedTuple):
+    signature: tuple[int, int]  # mtime, size
+    version: str
+
 
+_static_versions: dict[Path, StaticFileVersion] = {}
 
-def get_static_url(filename: str, randomize: bool = True) -> str:
+
+def get_static_url(filename: str, versioned: bool = True) -> str:
     filename = filename.strip('/')
     hashed_filename = get_staticfiles_manifest().get(filename)
     if hashed_filename:
         filename = hashed_filename
-    elif randomize:
-        filename = f'{filename}?v={get_random_string()}'
+    elif versioned and (version := get_static_file_version(filename)):
+        filename = f'{filename}?v={version}'
     return f'{STATIC_URL}{filename}'
 
 
-def inline_static_assets(pattern: str) -> str:
-    contents = get_staticfiles_contents(pattern)
-    return '\n'.join(contents).strip() or ''
+def get_static_file_version(filename: str) -> str:
+    # Content digest of asset missing from manifest, recomputed only when file changes
+    path = _find_static_file(filename)
+    if path is None:
+        return ''
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    version = _static_versions.get(path)
+    if version is None or version.signature != signature:
+        digest = _hash_file(path, digest_size=STATIC_VERSION_DIGEST_SIZE)
+        version = _static_versions[path] = StaticFileVersion(signature, digest)
+    return version.version
+
+
+def inline_static_assets(pattern: str, minify: bool = INLINE_MINIFY) -> str:
+    # Computed once per build, until any of matched files or their directories change
+    assets = _inline_assets.get((pattern, minify))
+    if assets is None or _get_stat_signature(assets.paths) != assets.signature:
+        assets = _inline_assets[pattern, minify] = _load_inline_assets(pattern, minify)
+    return assets.content
+
 
+def minify_script(content: str) -> str:
+    if not TERSER_BIN.is_file():
+        logger.warning('terser is not installed, inline scripts are not minified')
+        return content
+    result = run(
+        [TERSER_BIN, *TERSER_OPTIONS], input=content, capture_output=True, text=True, check=False
+    )
+    if result.returncode:
+        logger.warning('Unable to minify inline scripts: %s', result.stderr.strip())
+        return content
+    return result.stdout.strip()
 
-def get_random_string(length: int = 8) -> str:
-    return ''.join(rand_choice(ascii_lowercase) for _ in range(length))
 
+def _find_static_file(filename: str) -> Path | None:
+    # Theme static sources are preferred, they are copied to STATIC_BUILD_PATH after rendering
+    candidates = [STATIC_ASSETS_PATH / path / filename for path in THEME_STATIC_PATHS]
+    candidates.extend((STATIC_ASSETS_PATH / filename, STATIC_BUILD_PATH / filename))
+    return next((path for path in candidates if path.is_file()), None)
 
-def get_staticfiles_contents(pattern: str) -> Iterable[str]:
-    staticfiles = STATIC_ASSETS_PATH.glob(pattern)
-    files = filter(lambda file: file.suffix in ALLOWED_INLINE_SUFFIXES, staticfiles)
-    return [file.read_text() for file in files]
+
+def _load_inline_assets(pattern: str, minify: bool) -> InlineAssets:
+    files = sorted(STATIC_ASSETS_PATH.glob(pattern))
+    files = [file for file in files if file.suffix in ALLOWED_INLINE_SUFFIXES]
+    content = '\n'.join(file.read_text() for file in files).strip()
+    if minify and content and all(file.suffix == '.js' for file in files):
+        content = minify_script(content)
+    # New files matching pattern change mtime of their directory
+    paths = (STATIC_ASSETS_PATH, *dict.fromkeys(file.parent for file in files), *files)
+    return InlineAssets(paths, _get_stat_signature(paths), content)
+
+
+def _get_stat_signature(paths: Iterable[Path]) -> tuple | None:
+    signature = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
 
 
 @cache
@@ -48,14 +136,87 @@ def get_staticfiles_manifest() -> dict[str, str]:
         return {}
 
 
-def generate_staticfiles_manifest(hash_digest_size: int = 10) -> dict[str, str]:
-    manifest = {}
-    files = (f.resolve() for f in STATIC_BUILD_PATH.glob('*') if f.suffix in {'.css', '.js'})
+def generate_staticfiles_manifest(
+    hash_digest_size: int = 10,
+    incremental: bool = True,
+    prune: bool = True,
+    max_workers: int | None = None,
+) -> dict[str, str]:
+    # {stem}.{hash}{suffix} files are outputs of previous runs
+    hashed_pattern = re_compile(rf'^.+\.[0-9a-f]{{{hash_digest_size * 2}}}\.(?:css|js)$')
+    files = [
+        f
+        for f in sorted(STATIC_BUILD_PATH.glob('*'))
+        if f.suffix in HASHED_SUFFIXES and not hashed_pattern.match(f.name)
+    ]
+
+    # Files with unchanged size and mtime keep their hashed copies
+    index = _load_staticfiles_index() if incremental else {}
+    manifest, changed = {}, []
     for file in files:
-        contents = file.read_bytes()
-        hashstring = hashlib.blake2b(contents, digest_size=hash_digest_size).hexdigest()
-        hashed_filename = f'{file.stem}.{hashstring}{file.suffix}'
-        (STATIC_BUILD_PATH / hashed_filename).write_bytes(contents)
-        manifest[file.name] = hashed_filename
-    STATIC_MANIFEST.open('w').write(json_dumps(manifest))
+        stat = file.stat()
+        signature = [stat.st_mtime_ns, stat.st_size]
+        entry = index.get(file.name)
+        if entry and entry[:2] == signature and (STATIC_BUILD_PATH / entry[2]).is_file():
+            manifest[file.name] = entry[2]
+        else:
+            changed.append((file, signature))
+
+    hash_file = partial(_hash_file, digest_size=hash_digest_size)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(hash_file, (file for file, _ in changed))
+        for (file, signature), hashstring in zip(changed, digests, strict=True):
+            hashed_filename = f'{file.stem}.{hashstring}{file.suffix}'
+            hashed_file = STATIC_BUILD_PATH / hashed_filename
+            if not hashed_file.is_file():
+                _clone_file(file, hashed_file)
+            manifest[file.name] = hashed_filename
+            index[file.name] = [*signature, hashed_filename]
+
+    if prune:
+        current = set(manifest.values())
+        for file in STATIC_BUILD_PATH.glob('*'):
+            if hashed_pattern.match(file.name) and file.name not in current:
+                file.unlink()
+
+    if manifest != get_staticfiles_manifest():
+        _write_json(STATIC_MANIFEST, manifest)
+        get_staticfiles_manifest.cache_clear()
+    _write_json(STATIC_MANIFEST_INDEX, {k: v for k, v in index.items() if k in manifest})
     return manifest
+
+
+def _hash_file(path: Path, digest_size: int) -> str:
+    digest = hashlib.blake2b(digest_size=digest_size)
+    with path.open('rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clone_file(source: Path, target: Path) -> None:
+    # Reflink where filesystem supports it, otherwise copy: never a hardlink, sources rewritten
+    # in place (e.g. by a watching bundler) would change published content-hashed files too
+    try:
+        from fcntl import ioctl
+
+        with source.open('rb') as src, target.open('wb') as dst:
+            ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        target.unlink(missing_ok=True)
+    copyfile(source, target)
+
+
+def _load_staticfiles_index() -> dict[str, list]:
+    try:
+        return json_loads(STATIC_MANIFEST_INDEX.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp')
+    temp_path.write_text(json_dumps(data, sort_keys=True))
+    temp_path.replace(path)
@@ -12,6 +12,7 @@ from markup import renderer_ref
 from pelicanconf import DEFAULT_OG_IMAGE, SITEDESC, SITENAME
 
 from .media import get_processed_image_url
+from .profiling import profiler
 
 OG_IMAGE_WIDTH = 1200
 OG_IMAGE_HEIGHT = 630
@@ -36,7 +37,8 @@ def render_template(template_name: str, ctx: dict = None) -> str:
 
 
 def render_template_partial(partial_name: str, ctx: dict = None) -> str:
-    return render_template(f'partials/{partial_name}', ctx=ctx)
+    with profiler.measure(f'partial:{partial_name}'):
+        return render_template(f'partials/{partial_name}', ctx=ctx)
 
 
 class PageMetadata(NamedTuple):
@@ -0,0 +1,131 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+from threading import Lock
+from typing import NamedTuple
+
+LADDER_MIN_WIDTH = 320
+LADDER_MAX_WIDTH = 2800
+LADDER_STEP = 1.2
+LADDER_WIDTH_MULTIPLE = 16
+
+
+def build_width_ladder(
+    min_width: int = LADDER_MIN_WIDTH,
+    max_width: int = LADDER_MAX_WIDTH,
+    step: float = LADDER_STEP,
+    multiple: int = LADDER_WIDTH_MULTIPLE,
+) -> tuple[int, ...]:
+    ladder = [min_width]
+    while ladder[-1] < max_width:
+        width = -(-int(ladder[-1] * step) // multiple) * multiple  # round up to multiple
+        ladder.append(min(max(width, ladder[-1] + multiple), max_width))
+    return tuple(ladder)
+
+
+DEFAULT_WIDTH_LADDER = build_width_ladder()
+
+
+def get_bytes_overhead(requested_width: int, served_width: int) -> float:
+    # Encoded size grows roughly with pixel count, i.e. with width squared at fixed ratio
+    if served_width <= requested_width:
+        return 0.0
+    return (served_width / requested_width) ** 2 - 1
+
+
+class WidthPlan(NamedTuple):
+    widths: dict[int, int]  # requested width: served (ladder) width
+    overhead: float  # worst-case relative extra bytes
+
+    @property
+    def variants(self) -> int:
+        return len(set(self.widths.values()))
+
+
+def plan_widths(
+    requested: Iterable[int],
+    source_width: int,
+    max_variants: int,
+    ladder: tuple[int, ...] = DEFAULT_WIDTH_LADDER,
+) -> WidthPlan:
+    requested = sorted(set(requested))
+    if not requested:
+        return WidthPlan({}, 0.0)
+
+    # Ladder rungs at or above source width are the same image, keep only the first of them
+    candidates = [width for width in ladder if width < source_width]
+    cutoff = bisect_left(ladder, source_width)
+    if cutoff < len(ladder):
+        candidates.append(ladder[cutoff])
+
+    def snap(width: int) -> int:
+        index = bisect_left(candidates, width)
+        return candidates[min(index, len(candidates) - 1)]
+
+    # Requested widths are split into contiguous groups, each served by the rung snapped
+    # from its largest width; `best[k][i]` is the worst overhead of the first `i` widths
+    # served by `k` groups, minimized over all splits
+    count = len(requested)
+    max_variants = max(1, min(max_variants, count))
+    infinity = float('inf')
+    best = [[infinity] * (count + 1) for _ in range(max_variants + 1)]
+    split = [[0] * (count + 1) for _ in range(max_variants + 1)]
+    best[0][0] = 0.0
+    for groups in range(1, max_variants + 1):
+        for end in range(1, count + 1):
+            served = snap(requested[end - 1])
+            for start in range(end):
+                if best[groups - 1][start] == infinity:
+                    continue
+                cost = max(best[groups - 1][start], get_bytes_overhead(requested[start], served))
+                if cost < best[groups][end]:
+                    best[groups][end] = cost
+                    split[groups][end] = start
+
+    # Fewest groups reaching the lowest worst-case overhead
+    groups = min(range(1, max_variants + 1), key=lambda k: (best[k][count], k))
+    overhead = best[groups][count]
+    widths = {}
+    end = count
+    while groups:
+        start = split[groups][end]
+        served = snap(requested[end - 1])
+        for width in requested[start:end]:
+            widths[width] = served
+        end, groups = start, groups - 1
+    return WidthPlan(widths, overhead)
+
+
+class WidthPlanStats:
+    images: int = 0
+    requested_variants: int = 0
+    planned_variants: int = 0
+    worst_overhead: float = 0.0
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def record(self, requested_variants: int, plan: WidthPlan) -> None:
+        with self._lock:
+            self.images += 1
+            self.requested_variants += requested_variants
+            self.planned_variants += plan.variants
+            self.worst_overhead = max(self.worst_overhead, plan.overhead)
+
+    def merge(self, stats: dict[str, int | float]) -> None:
+        # Adds up stats recorded elsewhere, e.g. in worker processes
+        with self._lock:
+            self.images += stats['images']
+            self.requested_variants += stats['requested_variants']
+            self.planned_variants += stats['planned_variants']
+            self.worst_overhead = max(self.worst_overhead, stats['worst_overhead'])
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            'images': self.images,
+            'requested_variants': self.requested_variants,
+            'planned_variants': self.planned_variants,
+            'worst_overhead': round(self.worst_overhead, 3),
+        }
+
+
+width_plan_stats = WidthPlanStats()
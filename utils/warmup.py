@@ -0,0 +1,219 @@
+import asyncio
+from collections import Counter
+from collections.abc import Iterable
+from contextlib import suppress
+from ssl import create_default_context
+from time import perf_counter
+from urllib.parse import urlsplit
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 2
+DEFAULT_TIMEOUT = 30.0
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+BODYLESS_STATUSES = frozenset((204, 304))  # and 1xx, never followed by a body
+READ_CHUNK_SIZE = 64 * 1024
+REQUEST_HEADERS = {
+    'User-Agent': 'photos-cache-warmer/1.0',
+    # Resizer negotiates `format=auto` variants by `Accept`, warm the ones browsers get
+    'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8',
+    'Connection': 'keep-alive',
+}
+
+Origin = tuple[str, str, int]  # scheme, host, port
+
+
+class WarmupReport:
+    requested: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retried: int = 0
+    bytes_received: int = 0
+    elapsed: float = 0.0
+    statuses: Counter
+    errors: list[tuple[str, str]]
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.errors = []
+
+    def record(self, url: str, status: int | None, size: int, error: str = '') -> None:
+        self.requested += 1
+        self.bytes_received += size
+        self.statuses[status or 'error'] += 1
+        if status and status < 400:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.errors.append((url, error or str(status)))
+
+    def as_dict(self) -> dict:
+        return {
+            'requested': self.requested,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'retried': self.retried,
+            'bytes': self.bytes_received,
+            'elapsed': round(self.elapsed, 3),
+            'statuses': {str(k): v for k, v in self.statuses.items()},
+        }
+
+    def format(self) -> str:
+        elapsed = self.elapsed or 1e-9
+        return (
+            f'{self.requested} URLs in {self.elapsed:.2f}s: '
+            f'{self.succeeded} ok, {self.failed} failed, {self.retried} retries; '
+            f'{self.requested / elapsed:.1f} req/s, '
+            f'{self.bytes_received / elapsed / 1024 / 1024:.2f} MiB/s; '
+            f'statuses {dict(self.statuses)}'
+        )
+
+
+class HTTPConnection:
+    # Persistent HTTP/1.1 connection, (re)opened on demand
+    origin: Origin
+    reader: asyncio.StreamReader | None = None
+    writer: asyncio.StreamWriter | None = None
+
+    def __init__(self, origin: Origin):
+        self.origin = origin
+
+    async def get(self, target: str, host: str) -> tuple[int, int]:
+        if self.writer is None:
+            await self.open()
+        headers = ''.join(f'{k}: {v}\r\n' for k, v in REQUEST_HEADERS.items())
+        self.writer.write(f'GET {target} HTTP/1.1\r\nHost: {host}\r\n{headers}\r\n'.encode())
+        await self.writer.drain()
+        status, size, keep_alive = await self._read_response()
+        if not keep_alive:
+            await self.close()
+        return status, size
+
+    async def open(self) -> None:
+        scheme, host, port = self.origin
+        ssl = create_default_context() if scheme == 'https' else None
+        self.reader, self.writer = await asyncio.open_connection(host, port, ssl=ssl)
+
+    async def close(self) -> None:
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is None:
+            return
+        writer.close()
+        with suppress(OSError):
+            await writer.wait_closed()
+
+    async def _read_head(self) -> tuple[int, dict[str, str]]:
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+        status = int(status_line.split(' ', 2)[1])
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        return status, headers
+
+    async def _read_response(self) -> tuple[int, int, bool]:
+        status, headers = await self._read_head()
+        while 100 <= status < 200:  # interim responses, e.g. 103 Early Hints, the final one follows
+            status, headers = await self._read_head()
+        keep_alive = headers.get('connection') != 'close'
+
+        if status in BODYLESS_STATUSES:
+            return status, 0, keep_alive
+        if 'chunked' in headers.get('transfer-encoding', ''):
+            size = 0
+            while chunk_size := int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                await self._discard(chunk_size + 2)
+                size += chunk_size
+            while await self.reader.readuntil(b'\r\n') != b'\r\n':  # trailers
+                pass
+            return status, size, keep_alive
+        if 'content-length' in headers:
+            size = int(headers['content-length'])
+            await self._discard(size)
+            return status, size, keep_alive
+
+        size = 0
+        while chunk := await self.reader.read(READ_CHUNK_SIZE):
+            size += len(chunk)
+        return status, size, False
+
+    async def _discard(self, size: int) -> None:
+        while size > 0:
+            chunk = await self.reader.readexactly(min(size, READ_CHUNK_SIZE))
+            size -= len(chunk)
+
+
+def _get_origin(scheme: str, netloc: str) -> Origin:
+    parsed = urlsplit(f'{scheme}://{netloc}')
+    return scheme, parsed.hostname, parsed.port or (443 if scheme == 'https' else 80)
+
+
+async def _warmup_worker(
+    queue: asyncio.Queue,
+    report: WarmupReport,
+    retries: int,
+    timeout: float,
+    backoff: float,
+    origin_override: Origin | None,
+) -> None:
+    connections: dict[Origin, HTTPConnection] = {}
+    try:
+        while not queue.empty():
+            url = queue.get_nowait()
+            parsed = urlsplit(url)
+            origin = origin_override or _get_origin(parsed.scheme, parsed.netloc)
+            connection = connections.setdefault(origin, HTTPConnection(origin))
+            target = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+
+            status, size, error = None, 0, ''
+            for attempt in range(retries + 1):
+                if attempt:
+                    report.retried += 1
+                    await asyncio.sleep(backoff * 2 ** (attempt - 1))
+                try:
+                    status, size = await asyncio.wait_for(
+                        connection.get(target, parsed.netloc), timeout
+                    )
+                except (OSError, TimeoutError, asyncio.IncompleteReadError, ValueError) as exc:
+                    await connection.close()
+                    status, error = None, f'{type(exc).__name__}: {exc}'
+                    continue
+                if status not in RETRY_STATUSES:
+                    break
+            report.record(url, status, size, error)
+    finally:
+        for connection in connections.values():
+            await connection.close()
+
+
+async def warm_urls(
+    urls: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = DEFAULT_RETRIES,
+    timeout: float = DEFAULT_TIMEOUT,
+    backoff: float = RETRY_BACKOFF,
+    origin: str | None = None,
+) -> WarmupReport:
+    # `origin` (e.g. http://127.0.0.1:8000) replaces the host URLs are requested from
+    origin_override = None
+    if origin:
+        parsed = urlsplit(origin)
+        origin_override = _get_origin(parsed.scheme, parsed.netloc)
+
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    report = WarmupReport()
+    started = perf_counter()
+    workers = (
+        _warmup_worker(queue, report, retries, timeout, backoff, origin_override)
+        for _ in range(max(1, min(concurrency, queue.qsize())))
+    )
+    await asyncio.gather(*workers)
+    report.elapsed = perf_counter() - started
+    return report
+
+
+def run_warmup(urls: Iterable[str], **kwargs) -> WarmupReport:
+    return asyncio.run(warm_urls(urls, **kwargs))